@@ -1,11 +1,28 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from codec import LazyPinyin
 from config import config
 from database import init_db
-from models import PoemModel
+from fragment_cache import FragmentCacheExtension
+from http_cache import conditional, no_store
+import metrics
+from models import PoemModel, POEM_FIELDS
+import hmac
 import os
 
+class PoemJSONProvider(DefaultJSONProvider):
+    """JSON 序列化时解码按需加载的拼音"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, LazyPinyin):
+            return o.to_list()
+        return DefaultJSONProvider.default(o)
+
 # 创建 Flask 应用
 app = Flask(__name__)
+app.json = PoemJSONProvider(app)
+app.jinja_env.add_extension(FragmentCacheExtension)
 
 # 加载配置
 env = os.environ.get('FLASK_ENV', 'development')
@@ -14,7 +31,19 @@ app.config.from_object(config[env])
 # 初始化数据库
 init_db()
 
+@app.before_request
+def start_metrics():
+    """记录请求开始时间，重置本请求的 SQL 统计（按路由规则分组，不按具体 URL）"""
+    if app.config['METRICS_ENABLED'] or app.config['SLOW_QUERY_THRESHOLD_MS'] > 0:
+        metrics.start_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.after_request
+def finish_metrics(response):
+    """记录请求耗时和 SQL 统计"""
+    return metrics.finish_request(response, request.method)
+
 @app.route('/')
+@no_store
 def index():
     """首页 - 显示随机诗词和统计信息"""
     poem = PoemModel.get_random()
@@ -23,41 +52,55 @@ def index():
     return render_template('index.html', poem=poem, stats=stats, dynasties=dynasties)
 
 @app.route('/poem/<int:poem_id>')
+@conditional
 def poem_detail(poem_id):
     """诗词详情页"""
     poem = PoemModel.get_by_id(poem_id)
     if not poem:
         return render_template('404.html', message='诗词不存在'), 404
     
-    # 获取同作者的其他诗词（随机3首）
-    author_poems = PoemModel.get_by_author(poem['author'], page=1, page_size=4)
-    other_poems = [p for p in author_poems['poems'] if p['id'] != poem_id][:3]
+    # 相似诗词（预先计算）；尚未计算时显示同作者的其他诗词
+    other_poems = PoemModel.get_similar(poem_id, app.config['SIMILAR_POEMS_ON_DETAIL'])
+    similar = bool(other_poems)
+    if not similar:
+        author_poems = PoemModel.get_by_author(poem['author'], page_size=4)
+        other_poems = [p for p in author_poems['poems'] if p['id'] != poem_id][:3]
     
-    return render_template('poem_detail.html', poem=poem, other_poems=other_poems)
+    return render_template('poem_detail.html', poem=poem, other_poems=other_poems, similar=similar)
 
 @app.route('/search')
+@conditional
 def search():
     """搜索页面"""
     keyword = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    mode = 'pinyin' if request.args.get('mode') == 'pinyin' else None
     
     if not keyword:
-        return render_template('search.html', poems=[], keyword='', message='请输入搜索关键词')
+        return render_template('search.html', poems=[], keyword='', mode=mode, message='请输入搜索关键词')
     
-    poems = PoemModel.search(keyword)
+    result = PoemModel.search(keyword, page=page, mode=mode or 'text')
     
     message = None
-    if not poems:
+    if not result['poems']:
         message = f'未找到包含 "{keyword}" 的诗词'
     
-    return render_template('search.html', poems=poems, keyword=keyword, message=message)
+    return render_template('search.html', 
+                         poems=result['poems'], 
+                         keyword=keyword, 
+                         mode=mode,
+                         message=message,
+                         pagination=result)
 
 @app.route('/author/<author>')
+@conditional
 def author_poems(author):
-    """作者诗词列表"""
-    page = request.args.get('page', 1, type=int)
-    result = PoemModel.get_by_author(author, page=page)
+    """作者诗词列表（游标分页）"""
+    after = request.args.get('after')
+    before = request.args.get('before')
+    result = PoemModel.get_by_author(author, after=after, before=before)
     
-    if not result['poems']:
+    if not result['total']:
         return render_template('404.html', message=f'作者 "{author}" 不存在'), 404
     
     return render_template('author.html', 
@@ -66,12 +109,14 @@ def author_poems(author):
                          pagination=result)
 
 @app.route('/dynasty/<dynasty>')
+@conditional
 def dynasty_poems(dynasty):
-    """朝代诗词列表"""
-    page = request.args.get('page', 1, type=int)
-    result = PoemModel.get_by_dynasty(dynasty, page=page)
+    """朝代诗词列表（游标分页）"""
+    after = request.args.get('after')
+    before = request.args.get('before')
+    result = PoemModel.get_by_dynasty(dynasty, after=after, before=before)
     
-    if not result['poems']:
+    if not result['total']:
         return render_template('404.html', message=f'朝代 "{dynasty}" 不存在'), 404
     
     return render_template('dynasty.html', 
@@ -80,6 +125,7 @@ def dynasty_poems(dynasty):
                          pagination=result)
 
 @app.route('/authors')
+@conditional
 def authors():
     """作者列表"""
     page = request.args.get('page', 1, type=int)
@@ -90,6 +136,7 @@ def authors():
                          pagination=result)
 
 @app.route('/dynasties')
+@conditional
 def dynasties():
     """朝代列表"""
     dynasties_list = PoemModel.get_dynasties()
@@ -97,32 +144,198 @@ def dynasties():
 
 # API 接口
 @app.route('/api/poems/random')
+@no_store
 def api_random_poem():
     """API: 随机诗词"""
     count = request.args.get('count', 1, type=int)
-    count = min(count, 10)  # 最多10首
+    count = max(1, min(count, 10))  # 1 到 10 首
     
     poems = PoemModel.get_random(count=count)
     return jsonify({'success': True, 'data': poems})
 
+@app.route('/api/poems', methods=['GET', 'POST'])
+@conditional
+def api_poems():
+    """API: 按 ID 批量获取诗词
+
+    GET  /api/poems?ids=1,2,3&fields=title,author
+    POST /api/poems  {"ids": [1, 2, 3], "fields": ["title", "author"]}（ID 较多时使用）
+    """
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        payload = payload if isinstance(payload, dict) else {}
+        ids = payload.get('ids')
+        fields = payload.get('fields')
+    else:
+        ids = [value for value in request.args.get('ids', '').split(',') if value.strip()]
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',')] if fields else None
+
+    if not ids or not isinstance(ids, list):
+        return jsonify({'success': False, 'error': '缺少 ids 参数'}), 400
+    if request.method == 'POST':
+        # JSON 中只接受整数（1.5、true、"7" 等不做转换）
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in ids):
+            return jsonify({'success': False, 'error': 'ids 必须为整数'}), 400
+    else:
+        try:
+            ids = [int(value) for value in ids]
+        except ValueError:
+            return jsonify({'success': False, 'error': 'ids 必须为整数'}), 400
+    if len(ids) > app.config['API_MAX_BATCH_SIZE']:
+        return jsonify({'success': False,
+                        'error': f"一次最多获取 {app.config['API_MAX_BATCH_SIZE']} 首诗词"}), 400
+
+    error = _check_fields(fields)
+    if error:
+        return error
+
+    poems = PoemModel.get_many(ids, fields)
+    return jsonify({
+        'success': True,
+        'data': list(poems.values()),
+        'count': len(poems),
+        'missing': [poem_id for poem_id in dict.fromkeys(ids) if poem_id not in poems]
+    })
+
+def _check_fields(fields):
+    """校验 fields 参数，无效时返回错误响应"""
+    if fields is None:
+        return None
+    if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+        return jsonify({'success': False, 'error': 'fields 参数无效'}), 400
+    unknown = [field for field in fields if field not in POEM_FIELDS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"未知字段: {', '.join(unknown)}"}), 400
+    return None
+
+@app.route('/api/export')
+@conditional
+def api_export():
+    """API: 流式导出诗词（NDJSON，每行一首），可按朝代、作者筛选
+
+    GET /api/export?dynasty=唐&author=李白&fields=title,paragraphs
+    """
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',')] if fields else None
+    error = _check_fields(fields)
+    if error:
+        return error
+
+    poems = PoemModel.iter_poems(dynasty=request.args.get('dynasty'),
+                                 author=request.args.get('author'), fields=fields)
+
+    def generate():
+        for poem in poems:
+            yield app.json.dumps(poem, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/poems/<int:poem_id>/similar')
+@conditional
+def api_similar_poems(poem_id):
+    """API: 相似诗词（按相似度从高到低，score 为估计的字词重合度）"""
+    limit = request.args.get('limit', app.config['SIMILAR_POEMS_LIMIT'], type=int)
+    if not PoemModel.get_by_id(poem_id):
+        return jsonify({'success': False, 'error': '诗词不存在'}), 404
+    
+    poems = PoemModel.get_similar(poem_id, max(1, min(limit, app.config['SIMILAR_POEMS_LIMIT'])))
+    return jsonify({'success': True, 'data': poems})
+
 @app.route('/api/poems/search')
+@conditional
 def api_search():
-    """API: 搜索诗词"""
+    """API: 搜索诗词（按相关度排序，分页；mode=pinyin 按拼音搜索）"""
     keyword = request.args.get('q', '').strip()
     limit = request.args.get('limit', 20, type=int)
+    page = request.args.get('page', 1, type=int)
+    mode = request.args.get('mode', 'text')
     
     if not keyword:
         return jsonify({'success': False, 'error': '缺少搜索关键词'}), 400
+    if mode not in ('text', 'pinyin'):
+        return jsonify({'success': False, 'error': 'mode 只能为 text 或 pinyin'}), 400
     
-    poems = PoemModel.search(keyword, limit=limit)
-    return jsonify({'success': True, 'data': poems, 'count': len(poems)})
+    result = PoemModel.search(keyword, page=page, page_size=limit, mode=mode)
+    return jsonify({
+        'success': True,
+        'data': result['poems'],
+        'count': len(result['poems']),
+        'total': result['total'],
+        'total_is_estimate': result['total_is_estimate'],
+        'page': result['page'],
+        'page_size': result['page_size'],
+        'total_pages': result['total_pages']
+    })
+
+@app.route('/api/suggest')
+@conditional
+def api_suggest():
+    """API: 输入提示（作者、标题、首句的前缀匹配，支持拼音首字母）"""
+    prefix = request.args.get('q', '')
+    limit = request.args.get('limit', app.config['SUGGEST_LIMIT'], type=int)
+    suggestions = PoemModel.suggest(prefix, max(1, min(limit, app.config['SUGGEST_LIMIT'])))
+    return jsonify({'success': True, 'data': suggestions})
+
+@app.route('/api/authors/<author>/poems')
+@conditional
+def api_author_poems(author):
+    """API: 作者诗词列表（游标分页）"""
+    result = PoemModel.get_by_author(author, **_cursor_args())
+    return _page_response(result)
+
+@app.route('/api/dynasties/<dynasty>/poems')
+@conditional
+def api_dynasty_poems(dynasty):
+    """API: 朝代诗词列表（游标分页）"""
+    result = PoemModel.get_by_dynasty(dynasty, **_cursor_args())
+    return _page_response(result)
+
+def _cursor_args():
+    """解析游标分页参数 after / before / limit"""
+    limit = request.args.get('limit', app.config['POEMS_PER_PAGE'], type=int)
+    return {
+        'after': request.args.get('after'),
+        'before': request.args.get('before'),
+        'page_size': max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+    }
+
+def _page_response(result):
+    """游标分页结果的 JSON 响应"""
+    if not result['total']:
+        return jsonify({'success': False, 'error': '没有找到诗词'}), 404
+    
+    return jsonify({
+        'success': True,
+        'data': result['poems'],
+        'total': result['total'],
+        'page_size': result['page_size'],
+        'prev_cursor': result['prev_cursor'] if result['has_prev'] else None,
+        'next_cursor': result['next_cursor'] if result['has_next'] else None
+    })
 
 @app.route('/api/stats')
+@conditional
 def api_stats():
     """API: 统计信息"""
     stats = PoemModel.get_stats()
     return jsonify({'success': True, 'data': stats})
 
+@app.route('/metrics')
+@no_store
+def prometheus_metrics():
+    """运行指标（Prometheus 文本格式）；设置了 METRICS_DIR 时为全部 worker 进程的汇总
+
+    设置了 METRICS_TOKEN 时需要 Authorization: Bearer <METRICS_TOKEN>。
+    """
+    if not app.config['METRICS_ENABLED']:
+        return render_template('404.html', message='页面不存在'), 404
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                         f'Bearer {token}'.encode('utf-8')):
+        return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'}, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.errorhandler(404)
 def page_not_found(e):
     """404 错误处理"""
@@ -0,0 +1,189 @@
+"""
+ASGI 入口
+
+将 Flask 应用包装为 ASGI 应用，每个请求在线程池中执行。搜索类请求（代价高、耗时不稳定）
+和详情、列表等点查询使用两个独立的有界线程池：慢搜索占满搜索线程池时只会让后续搜索排队，
+不会阻塞其他页面。每个线程复用自己的只读 SQLite 连接（见 database.get_db）。
+
+请求体读完后才交给 Flask（超过 MAX_CONTENT_LENGTH 时直接返回 413），CONTENT_LENGTH 按实际长度设置，
+分块传输的请求体同样可以读取；客户端断开后不再执行请求，流式响应也会停止生成。
+
+运行：
+    uvicorn asgi:application --workers 4
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker --workers 4
+"""
+
+import asyncio
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app import app
+from config import Config
+
+# 使用搜索线程池的路径（及其子路径；搜索和导出等耗时长的请求）
+SEARCH_PATHS = ('/search', '/api/poems/search', '/api/export')
+
+class ClientDisconnected(Exception):
+    """客户端在请求完成前断开连接"""
+
+class RequestTooLarge(Exception):
+    """请求体超过 MAX_CONTENT_LENGTH"""
+
+def build_environ(scope, body):
+    """根据 ASGI 请求构造 WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ[name] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    # 请求体已完整读取，按实际长度设置（分块传输的请求没有 Content-Length 头）
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+async def read_body(scope, receive, max_length):
+    """读取完整的请求体，超过 max_length 字节时抛出 RequestTooLarge，客户端断开时抛出 ClientDisconnected"""
+    for name, value in scope['headers']:
+        if name == b'content-length' and value.isdigit() and max_length is not None \
+                and int(value) > max_length:
+            raise RequestTooLarge()
+
+    chunks = []
+    length = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        length += len(chunk)
+        if max_length is not None and length > max_length:
+            raise RequestTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+class ThreadPoolASGI:
+    """在线程池中运行 WSGI 应用的 ASGI 应用
+
+    响应在线程中逐块生成，每一块通过事件循环发送并等待发送完成，流式响应同样适用。
+    """
+
+    def __init__(self, wsgi_app, search_threads, lookup_threads):
+        self.wsgi_app = wsgi_app
+        self.search_executor = ThreadPoolExecutor(search_threads, thread_name_prefix='search')
+        self.lookup_executor = ThreadPoolExecutor(lookup_threads, thread_name_prefix='lookup')
+
+    def executor_for(self, path):
+        """按路径选择线程池"""
+        if any(path == prefix or path.startswith(prefix + '/') for prefix in SEARCH_PATHS):
+            return self.search_executor
+        return self.lookup_executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.search_executor.shutdown(wait=False)
+                self.lookup_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        try:
+            body = await read_body(scope, receive, self.wsgi_app.config['MAX_CONTENT_LENGTH'])
+        except ClientDisconnected:
+            return
+        except RequestTooLarge:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                                    (b'connection', b'close')]})
+            await send({'type': 'http.response.body', 'body': b'Request Entity Too Large'})
+            return
+
+        # 请求执行期间监听客户端断开，流式响应据此停止生成
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, body)
+        try:
+            await loop.run_in_executor(self.executor_for(scope['path']),
+                                       self._run_wsgi, environ, send, loop, disconnected)
+        finally:
+            watcher.cancel()
+
+    def _run_wsgi(self, environ, send, loop, disconnected):
+        """在线程池中运行 WSGI 应用，将响应交给事件循环发送；客户端已断开时不执行或停止发送"""
+        if disconnected.is_set():
+            return
+
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return lambda data: None
+
+        def send_start():
+            if not response.get('started'):
+                call({'type': 'http.response.start', 'status': response['status'],
+                      'headers': response['headers']})
+                response['started'] = True
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    send_start()
+                    call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_start()
+            call({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+application = ThreadPoolASGI(app, Config.ASGI_SEARCH_THREADS, Config.ASGI_LOOKUP_THREADS)
@@ -0,0 +1,10 @@
+"""
+性能测试
+
+- corpus.py：确定性的合成诗词语料生成器（无需下载 chinese-poetry 数据）
+- run.py：在合成语料上测量 PoemModel 各查询方法和各路由的耗时，输出 p50/p95/p99 及 JSON 结果
+
+用法：
+    python -m benchmarks.run --size 100k --output bench.json
+    python -m benchmarks.run --size 100k --compare bench.json
+"""
@@ -0,0 +1,152 @@
+"""
+合成诗词语料
+
+按固定随机种子生成格律近似真实的诗词（五言、七言绝句和律诗，长短句的词、曲），
+作者的作品数服从长尾分布，朝代分布参照 chinese-poetry。行经过导入脚本的 normalize_poem
+规整后写入由 init_db 创建的数据库，拼音由常用字的拼音表拼出，
+因此表结构、索引、全文索引和拼音索引都与正式导入的数据库一致。
+"""
+
+import random
+import sqlite3
+import time
+from pypinyin import pinyin, Style
+from codec import decode_paragraphs, encode_pinyin
+from config import Config
+from database import (init_db, rebuild_fts, refresh_aggregates, bump_dataset_version,
+                      create_indexes, drop_indexes, load_syllable_ids, add_syllables,
+                      pinyin_search_text, pinyin_fts_insert)
+from data.scripts.import_data import normalize_poem, INSERT_SQL
+
+# 常用于古诗词的汉字
+CHARACTERS = (
+    '春花秋月何时了往事知多少小楼昨夜又东风故国不堪回首明中雕栏玉砌应犹在只是朱颜改问君能有几'
+    '愁恰似一江水向流床前光疑地上霜举头望低思乡白日依山尽黄河入海欲穷千里目更层大漠孤烟直长落'
+    '圆红豆生南国来发枝愿采撷此物最相空新雨后天气晚鸣竹喧归浣女莲动下渔舟随意芳歇王孙自可留独'
+    '坐幽篁弹琴复啸深林人不见照苔清泉石松间照寒山远径斜处家停车爱枫叶于二青云外客路行前潮平两'
+    '岸阔风正一帆悬残旧年夜书何达归雁洛阳边草木城深感泪恨别鸟惊心火连三金抵万搔更短浑欲胜簪'
+    '酒剑歌马关塞沙场烽将军战士征鼓角边声旗城楼柳笛杨雪梅兰菊桃李杏梧桐芭蕉荷荻苇蒲菱藕松柏'
+    '江湖溪涧峰岭峦谷岩洞泉瀑潭池塘舟帆桨棹渡津驿亭台阁轩窗帘幕屏烛灯香炉茶琴棋书画笔墨纸砚'
+)
+SURNAMES = '李杜王白苏辛陆孟韩柳欧范晏秦黄周姜吴刘张陈杨赵孙朱胡郭何高林罗郑梁谢宋唐许邓冯'
+GIVEN_NAMES = '白甫维居易轼弃疾游浩然愈宗元修仲淹殊观庭坚邦彦夔文英克庄禹锡牧商隐庭筠之涣昌龄适参'
+
+# 朝代及占比（约为 chinese-poetry 中的比例）
+DYNASTIES = [('唐', 0.18), ('宋', 0.7), ('元', 0.03), ('先秦', 0.01), ('魏晋', 0.01),
+             ('五代', 0.02), ('清', 0.05)]
+
+# 体裁：(每句字数, 句数)
+FORMS = [(5, 4), (7, 4), (5, 8), (7, 8)]
+CI_LINE_LENGTHS = [3, 4, 5, 6, 7, 9]
+
+TAGS = ['写景', '抒情', '送别', '思乡', '边塞', '咏物', '怀古', '闺怨', '田园', '山水']
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+def parse_size(value):
+    """解析语料规模（10k / 100k / 1m 或整数）"""
+    value = value.lower()
+    return SIZES[value] if value in SIZES else int(value)
+
+def _make_authors(rng, count):
+    """生成作者名及作品数权重（长尾分布：少数作者作品很多）"""
+    names = set()
+    while len(names) < count:
+        names.add(rng.choice(SURNAMES) + ''.join(rng.choices(GIVEN_NAMES, k=rng.choice((1, 2)))))
+    names = sorted(names)
+    rng.shuffle(names)
+    weights = [1.0 / (rank + 1) ** 0.9 for rank in range(count)]
+    return names, weights
+
+def _make_line(rng, length):
+    return ''.join(rng.choices(CHARACTERS, k=length))
+
+def generate_poem(rng, author, dynasty):
+    """生成一首诗词（chinese-poetry 的 JSON 格式）"""
+    if dynasty in ('宋', '元', '五代') and rng.random() < 0.4:
+        # 词、曲：长短句
+        sentences = [_make_line(rng, rng.choice(CI_LINE_LENGTHS)) for _ in range(rng.randint(6, 16))]
+    else:
+        length, count = rng.choice(FORMS)
+        sentences = [_make_line(rng, length) for _ in range(count)]
+
+    # 两个短句组成一行
+    paragraphs = [f'{sentences[i]}，{sentences[i + 1]}。' if i + 1 < len(sentences) else f'{sentences[i]}。'
+                  for i in range(0, len(sentences), 2)]
+    title = '无题' if rng.random() < 0.03 else _make_line(rng, rng.randint(2, 6))
+    tags = rng.sample(TAGS, rng.randint(0, 2))
+    return {'title': title, 'author': author, 'paragraphs': paragraphs, 'tags': tags}
+
+def _character_pinyin():
+    """语料用字的拼音表（字 -> 带声调拼音），标点原样保留"""
+    table = {ch: pinyin(ch, style=Style.TONE)[0][0] for ch in set(CHARACTERS)}
+    table.update({'，': '，', '。': '。'})
+    return table
+
+def generate_corpus(path, size, seed=42, with_pinyin=True):
+    """在 path 生成 size 首诗词的数据库（已存在的数据会被清空）"""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    authors, weights = _make_authors(rng, max(10, size // 30))
+    dynasty_names = [name for name, _ in DYNASTIES]
+    dynasty_weights = [weight for _, weight in DYNASTIES]
+    author_dynasty = {author: rng.choices(dynasty_names, dynasty_weights)[0] for author in authors}
+    char_pinyin = _character_pinyin() if with_pinyin else None
+
+    previous_path = Config.DATABASE_PATH
+    Config.DATABASE_PATH = path
+    try:
+        init_db()
+    finally:
+        Config.DATABASE_PATH = previous_path
+
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('DELETE FROM poems')
+    cursor.execute("INSERT INTO poems_fts(poems_fts) VALUES('delete-all')")
+    cursor.execute("INSERT INTO poems_pinyin_fts(poems_pinyin_fts) VALUES('delete-all')")
+    drop_indexes(cursor)
+    syllable_ids = load_syllable_ids(cursor)
+
+    batch = []
+    for i in range(size):
+        author = rng.choices(authors, weights)[0]
+        poem = generate_poem(rng, author, author_dynasty[author])
+        row = normalize_poem(poem, author_dynasty[author])
+        batch.append(row + (f'bench:{seed}:{i}',))
+        if len(batch) >= 50000 or i == size - 1:
+            cursor.executemany(INSERT_SQL, batch)
+            batch = []
+
+    if with_pinyin:
+        add_syllables(cursor, syllable_ids, set(char_pinyin.values()))
+        last_id = 0
+        while True:
+            cursor.execute('SELECT id, content, line_offsets FROM poems WHERE id > ? ORDER BY id LIMIT 50000',
+                           (last_id,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            updates = []
+            search_texts = []
+            for poem_id, content, line_offsets in rows:
+                lines = [[char_pinyin[ch] for ch in line]
+                         for line in decode_paragraphs(content, line_offsets)]
+                text = pinyin_search_text(lines)
+                updates.append((encode_pinyin(lines, syllable_ids), text, poem_id))
+                search_texts.append((poem_id, text))
+            cursor.executemany('UPDATE poems SET pinyin = ?, pinyin_text = ? WHERE id = ?', updates)
+            pinyin_fts_insert(cursor, search_texts)
+
+    create_indexes(cursor)
+    rebuild_fts(conn)
+    refresh_aggregates(conn)
+    bump_dataset_version(conn)
+    conn.commit()
+    cursor.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+    return time.perf_counter() - started
@@ -0,0 +1,246 @@
+"""
+在合成语料上测量 PoemModel 各查询方法和各路由（Flask 测试客户端）的耗时
+
+    python -m benchmarks.run --size 10k                  # 输出 p50/p95/p99 表格
+    python -m benchmarks.run --size 100k --output a.json  # 同时保存 JSON 结果
+    python -m benchmarks.run --size 100k --compare a.json # 与之前的结果对比
+
+语料数据库按规模和随机种子缓存在临时目录中，--rebuild 重新生成。
+默认每次调用前清空进程内缓存，测量的是实际查询的耗时；--warm 保留缓存。
+完全离线运行，不需要 chinese-poetry 数据。
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+from config import Config
+from benchmarks.corpus import generate_corpus, parse_size
+
+def percentile(samples, q):
+    """已排序样本的分位数"""
+    return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))]
+
+def measure(func, rng, iterations, warmup, clear):
+    """调用 func(rng) 若干次，返回耗时统计（毫秒）"""
+    from cache import clear_caches
+
+    for _ in range(warmup):
+        func(rng)
+
+    samples = []
+    for _ in range(iterations):
+        if clear:
+            clear_caches()
+        started = time.perf_counter()
+        func(rng)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': round(sum(samples) / len(samples), 4),
+        'p50_ms': round(percentile(samples, 0.5), 4),
+        'p95_ms': round(percentile(samples, 0.95), 4),
+        'p99_ms': round(percentile(samples, 0.99), 4),
+        'max_ms': round(samples[-1], 4),
+    }
+
+def load_inputs(path, seed):
+    """从语料中抽取查询参数：作者（多产和少产）、朝代、ID、搜索词、拼音首字母、分页游标"""
+    from models import PoemModel
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    authors = [row[0] for row in conn.execute('SELECT author FROM authors ORDER BY poem_count DESC')]
+    dynasties = [row[0] for row in conn.execute('SELECT dynasty FROM dynasties')]
+    max_id = conn.execute('SELECT MAX(id) FROM poems').fetchone()[0]
+    samples = conn.execute('SELECT content, pinyin_text FROM poems WHERE id IN (%s)' % ','.join(
+        str(rng.randint(1, max_id)) for _ in range(200))).fetchall()
+
+    # 作品最多的作者的中间一页
+    top_author = authors[0]
+    middle = conn.execute('''
+        SELECT is_untitled, id FROM poems WHERE author = ?
+        ORDER BY is_untitled, id LIMIT 1 OFFSET (SELECT poem_count / 2 FROM authors WHERE author = ?)
+    ''', (top_author, top_author)).fetchone()
+    conn.close()
+
+    keywords = []
+    pinyin_keywords = []
+    for content, pinyin_text in samples:
+        start = rng.randint(0, max(0, len(content) - 4))
+        keywords.append(content[start:start + 2])
+        if pinyin_text:
+            syllables = pinyin_text.split()[:4]
+            pinyin_keywords.append(''.join(syllable[0] for syllable in syllables))
+
+    return {
+        'authors': authors,
+        'top_authors': authors[:max(1, len(authors) // 100)],
+        'dynasties': dynasties,
+        'max_id': max_id,
+        'keywords': keywords,
+        'pinyin_keywords': pinyin_keywords,
+        'top_author': top_author,
+        'middle_cursor': PoemModel.encode_cursor({'is_untitled': middle[0], 'id': middle[1]}),
+    }
+
+def model_cases(inputs):
+    """PoemModel 各查询方法：名称 -> func(rng)"""
+    from models import PoemModel
+
+    authors = inputs['authors']
+    top_authors = inputs['top_authors']
+    dynasties = inputs['dynasties']
+    max_id = inputs['max_id']
+    keywords = inputs['keywords']
+    pinyin_keywords = inputs['pinyin_keywords'] or ['a']
+    return {
+        'search': lambda rng: PoemModel.search(rng.choice(keywords)),
+        'search_page5': lambda rng: PoemModel.search(rng.choice(keywords), page=5),
+        'search_two_terms': lambda rng: PoemModel.search(
+            f'{rng.choice(keywords)} {rng.choice(keywords)}'),
+        'search_pinyin': lambda rng: PoemModel.search(rng.choice(pinyin_keywords), mode='pinyin'),
+        'get_by_id': lambda rng: PoemModel.get_by_id(rng.randint(1, max_id)),
+        'get_many_100': lambda rng: PoemModel.get_many([rng.randint(1, max_id) for _ in range(100)]),
+        'get_similar': lambda rng: PoemModel.get_similar(rng.randint(1, max_id)),
+        'get_random': lambda rng: PoemModel.get_random(),
+        'get_random_10': lambda rng: PoemModel.get_random(count=10),
+        'get_by_author': lambda rng: PoemModel.get_by_author(rng.choice(authors)),
+        'get_by_author_top': lambda rng: PoemModel.get_by_author(rng.choice(top_authors)),
+        'get_by_author_middle': lambda rng: PoemModel.get_by_author(
+            inputs['top_author'], after=inputs['middle_cursor']),
+        'get_by_author_last': lambda rng: PoemModel.get_by_author(rng.choice(top_authors),
+                                                                   before='end'),
+        'get_by_dynasty': lambda rng: PoemModel.get_by_dynasty(rng.choice(dynasties)),
+        'get_by_dynasty_last': lambda rng: PoemModel.get_by_dynasty(rng.choice(dynasties),
+                                                                     before='end'),
+        'get_all_authors': lambda rng: PoemModel.get_all_authors(),
+        'get_all_authors_deep': lambda rng: PoemModel.get_all_authors(
+            page=max(1, len(authors) // Config.AUTHORS_PER_PAGE)),
+        'get_dynasties': lambda rng: PoemModel.get_dynasties(),
+        'get_stats': lambda rng: PoemModel.get_stats(),
+        'suggest': lambda rng: PoemModel.suggest(rng.choice(keywords)[:1]),
+    }
+
+def route_cases(inputs, client):
+    """各路由：名称 -> func(rng)"""
+    authors = inputs['authors']
+    dynasties = inputs['dynasties']
+    max_id = inputs['max_id']
+    keywords = inputs['keywords']
+    pinyin_keywords = inputs['pinyin_keywords'] or ['a']
+
+    def get(url):
+        response = client.get(url)
+        response.get_data()
+        return response
+
+    return {
+        'GET /': lambda rng: get('/'),
+        'GET /poem/<id>': lambda rng: get(f'/poem/{rng.randint(1, max_id)}'),
+        'GET /search': lambda rng: get(f'/search?q={quote(rng.choice(keywords))}'),
+        'GET /search?mode=pinyin': lambda rng: get(
+            f'/search?mode=pinyin&q={quote(rng.choice(pinyin_keywords))}'),
+        'GET /author/<author>': lambda rng: get(f'/author/{quote(rng.choice(authors))}'),
+        'GET /dynasty/<dynasty>': lambda rng: get(f'/dynasty/{quote(rng.choice(dynasties))}'),
+        'GET /authors': lambda rng: get('/authors'),
+        'GET /dynasties': lambda rng: get('/dynasties'),
+        'GET /api/poems/random': lambda rng: get('/api/poems/random'),
+        'GET /api/poems/search': lambda rng: get(f'/api/poems/search?q={quote(rng.choice(keywords))}'),
+        'GET /api/poems?ids=': lambda rng: get('/api/poems?ids=' + ','.join(
+            str(rng.randint(1, max_id)) for _ in range(50))),
+        'GET /api/poems/<id>/similar': lambda rng: get(f'/api/poems/{rng.randint(1, max_id)}/similar'),
+        'GET /api/suggest': lambda rng: get(f'/api/suggest?q={quote(rng.choice(keywords)[:1])}'),
+        'GET /api/stats': lambda rng: get('/api/stats'),
+    }
+
+def print_table(results, baseline=None):
+    """打印结果表格；有对比基线时显示 p50 / p95 的变化"""
+    header = f"{'名称':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'p50 变化':>12}{'p95 变化':>12}"
+    print(header)
+    print('-' * (len(header) + 8))
+    for name, stats in results.items():
+        line = f"{name:<28}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+        old = (baseline or {}).get(name)
+        if old:
+            for key in ('p50_ms', 'p95_ms'):
+                change = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                line += f'{change:>+11.1f}%'
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='PoemModel 与路由性能测试（合成语料）')
+    parser.add_argument('--size', default='10k', help='语料规模：10k / 100k / 1m 或整数（默认 10k）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子（默认 42）')
+    parser.add_argument('--iterations', type=int, default=200, help='每项测量次数（默认 200）')
+    parser.add_argument('--warmup', type=int, default=10, help='每项预热次数（默认 10）')
+    parser.add_argument('--warm', action='store_true', help='保留进程内缓存（默认每次调用前清空）')
+    parser.add_argument('--only', choices=('model', 'routes'), help='只测量模型方法或路由')
+    parser.add_argument('--db', help='语料数据库路径（默认在临时目录中按规模缓存）')
+    parser.add_argument('--rebuild', action='store_true', help='重新生成语料数据库')
+    parser.add_argument('--output', help='保存 JSON 结果的文件')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比')
+    args = parser.parse_args()
+
+    size = parse_size(args.size)
+    path = args.db or os.path.join(tempfile.gettempdir(), f'poetry-bench-{size}-{args.seed}.db')
+    # 初始化信息输出到标准错误，不混入结果表格
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.rebuild or not os.path.exists(path):
+            print(f'生成 {size} 首诗词的合成语料: {path}')
+            elapsed = generate_corpus(path, size, seed=args.seed)
+            print(f'  用时 {elapsed:.1f} 秒')
+
+        # 应用和模型在导入后使用语料数据库
+        Config.DATABASE_PATH = path
+        from app import app
+
+    inputs = load_inputs(path, args.seed)
+    cases = {}
+    if args.only != 'routes':
+        cases.update(model_cases(inputs))
+    if args.only != 'model':
+        cases.update(route_cases(inputs, app.test_client()))
+
+    results = {}
+    for name, func in cases.items():
+        rng = random.Random(f'{args.seed}:{name}')
+        results[name] = measure(func, rng, args.iterations, args.warmup, clear=not args.warm)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_table(results, baseline)
+
+    if args.output:
+        report = {
+            'meta': {
+                'size': size,
+                'seed': args.seed,
+                'iterations': args.iterations,
+                'warm': args.warm,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
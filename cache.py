@@ -0,0 +1,106 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# 所有已创建的缓存，便于统计命中率
+_caches = {}
+
+_MISSING = object()
+
+class LRUCache:
+    """带过期时间的 LRU 缓存（线程安全）
+
+    version_func 返回当前数据版本，版本变化时（重新导入数据后）整个缓存失效。
+    缓存的值会被多个请求共享，调用方不应修改。
+    """
+
+    def __init__(self, name, maxsize, ttl, version_func=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_func = version_func
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        _caches[name] = self
+
+    def _check_version(self):
+        """数据版本变化时清空缓存（调用方需持有锁）"""
+        if self.version_func is None:
+            return
+        version = self.version_func()
+        if version != self._version:
+            self._data.clear()
+            self._version = version
+
+    def get(self, key, default=None):
+        """读取缓存，不存在或已过期时返回 default"""
+        if self.maxsize <= 0:
+            return default
+
+        with self._lock:
+            self._check_version()
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的项"""
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """返回缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+def cached(cache):
+    """缓存函数返回值的装饰器，以函数名和参数作为键（None 结果不缓存）"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                if value is not None:
+                    cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
+
+def cache_stats():
+    """返回所有缓存的统计信息"""
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+def clear_caches():
+    """清空所有缓存"""
+    for cache in _caches.values():
+        cache.clear()
@@ -0,0 +1,117 @@
+"""
+诗词字段的紧凑存储格式
+
+- line_offsets：每一句在 content 中的结束位置，uint32 数组，取代重复保存正文的 paragraphs JSON
+- excerpt：列表页使用的摘要（前两句），列表查询只读取摘要而不读取正文和拼音
+- pinyin：音节 id 数组（对应 pinyin_syllables 表），0 表示换行，取代带声调拼音的 JSON 文本；
+  第一个字节为数组类型码（'H' 或 'I'），音节表超过 65535 项时自动使用 4 字节
+"""
+
+from array import array
+
+# 行分隔符在音节 id 数组中的取值（音节 id 从 1 开始）
+LINE_BREAK = 0
+
+# 摘要包含的句数
+EXCERPT_LINES = 2
+
+def encode_line_offsets(paragraphs):
+    """将诗句列表编码为 content 中各句的结束位置"""
+    offsets = array('I')
+    position = 0
+    for line in paragraphs:
+        position += len(line)
+        offsets.append(position)
+    return offsets.tobytes()
+
+def decode_paragraphs(content, line_offsets):
+    """根据结束位置将 content 还原为诗句列表"""
+    offsets = array('I')
+    offsets.frombytes(line_offsets)
+
+    paragraphs = []
+    start = 0
+    for end in offsets:
+        paragraphs.append(content[start:end])
+        start = end
+    return paragraphs
+
+def make_excerpt(paragraphs):
+    """列表页摘要：前两句，以换行分隔"""
+    return '\n'.join(paragraphs[:EXCERPT_LINES])
+
+def encode_pinyin(pinyin_lines, syllable_ids):
+    """将每句的拼音列表编码为音节 id 数组，syllable_ids 为音节到 id 的映射（需包含全部音节）"""
+    ids = []
+    for i, line in enumerate(pinyin_lines):
+        if i > 0:
+            ids.append(LINE_BREAK)
+        ids.extend(syllable_ids[syllable] for syllable in line)
+
+    typecode = 'H' if not ids or max(ids) <= 0xFFFF else 'I'
+    return typecode.encode('ascii') + array(typecode, ids).tobytes()
+
+def decode_pinyin(blob, syllables):
+    """将音节 id 数组还原为每句的拼音列表，syllables 为按 id 索引的音节列表"""
+    if len(blob) <= 1:
+        return []
+
+    ids = array(chr(blob[0]))
+    ids.frombytes(blob[1:])
+
+    lines = [[]]
+    for syllable_id in ids:
+        if syllable_id == LINE_BREAK:
+            lines.append([])
+        else:
+            lines[-1].append(syllables[syllable_id])
+    return lines
+
+def decode_first_line_ids(blob):
+    """只取第一句的音节 id（不解码整首诗的拼音）"""
+    if not blob or len(blob) <= 1:
+        return array('H')
+
+    ids = array(chr(blob[0]))
+    ids.frombytes(blob[1:])
+    try:
+        return ids[:ids.index(LINE_BREAK)]
+    except ValueError:
+        return ids
+
+class LazyPinyin:
+    """按需解码的拼音
+
+    列表页等不显示拼音的场景不会产生解码开销；模板第一次访问（判断、取长度、下标）时才解码。
+    对象经 LRU 缓存在线程间共享：解码结果只赋值一次，原始数据保留，并发解码时结果相同。
+    """
+
+    __slots__ = ('_blob', '_syllables', '_lines')
+
+    def __init__(self, blob, syllables):
+        self._blob = blob
+        self._syllables = syllables
+        self._lines = None
+
+    def to_list(self):
+        """解码并返回每句的拼音列表"""
+        lines = self._lines
+        if lines is None:
+            lines = decode_pinyin(self._blob, self._syllables)
+            self._lines = lines
+        return lines
+
+    def __len__(self):
+        return len(self.to_list())
+
+    def __getitem__(self, index):
+        return self.to_list()[index]
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __bool__(self):
+        return bool(self.to_list())
+
+    def __repr__(self):
+        return f'LazyPinyin({self.to_list()!r})'
@@ -8,13 +8,86 @@ class Config:
     
     # 数据库配置
     DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'poetry.db')
+    # 数据库快照目录：导入数据、生成拼音时在新快照中写入，完成后 DATABASE_PATH（符号链接）原子切换
+    SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), 'data', 'snapshots')
+    SNAPSHOT_KEEP = 3   # 保留的快照数（含当前快照），用于回滚
+    # 每个连接的页缓存大小（KB）和内存映射大小（字节）
+    SQLITE_CACHE_SIZE_KB = 64 * 1024
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    # 每个连接缓存的预编译语句数量
+    SQLITE_CACHED_STATEMENTS = 256
+    # 等待写锁的时间（秒）
+    SQLITE_BUSY_TIMEOUT = 30
     
     # 分页配置
     POEMS_PER_PAGE = 20
     AUTHORS_PER_PAGE = 50
+    API_MAX_PAGE_SIZE = 50
+    API_MAX_BATCH_SIZE = 500   # 批量接口一次最多获取的诗词数
+    MAX_CONTENT_LENGTH = 1024 * 1024   # 请求体的最大字节数（Flask 和 asgi.py 均按此拒绝，413）
+    EXPORT_CHUNK_SIZE = 1000   # 导出时每次从游标读取的行数
     
     # 搜索配置
-    SEARCH_RESULTS_LIMIT = 50
+    SEARCH_RESULTS_LIMIT = 50  # 单页最大结果数
+    # bm25 列权重：标题、作者、正文
+    SEARCH_BM25_WEIGHTS = (10.0, 5.0, 1.0)
+    # 命中总数最多统计到的条数，超出后显示为估计值
+    SEARCH_COUNT_LIMIT = 1000
+    
+    # 输入提示（/api/suggest）：返回条数、查询时直接比较的前缀范围上限（更大的范围预先计算）、是否索引首句
+    SUGGEST_LIMIT = 10
+    SUGGEST_SCAN_LIMIT = 200
+    SUGGEST_FIRST_LINES = True
+    
+    # 相似诗词（build_neighbors.py 离线计算）：每首保存的条数、详情页显示的条数
+    SIMILAR_POEMS_LIMIT = 10
+    SIMILAR_POEMS_ON_DETAIL = 3
+    
+    # 随机诗词 id 缓存的刷新间隔（秒）
+    RANDOM_ID_CACHE_TTL = 600
+    
+    # 进程内查询缓存（LRU + 过期时间），容量为 0 时禁用
+    POEM_CACHE_SIZE = 10000      # 单首诗词（get_by_id）
+    LIST_CACHE_SIZE = 2000       # 作者、朝代列表分页
+    CACHE_TTL = 3600             # 秒
+    FRAGMENT_CACHE_SIZE = 5000   # 模板片段（诗词正文、列表卡片的渲染结果）
+    # 片段缓存的磁盘目录，多个 worker 共享；为空时只使用内存
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR') or None
+    FRAGMENT_CACHE_DISK_MAX_ENTRIES = 200000   # 磁盘上当前版本最多保留的片段数，超出时删除最早写入的
+    FRAGMENT_CACHE_PRUNE_INTERVAL = 60         # 清理磁盘片段的间隔（秒）
+    FRAGMENT_CACHE_GRACE = 300                 # 其他版本的目录超过该时间（秒）没有写入后才删除
+    # 检查数据版本（重新导入后缓存失效）的间隔（秒）
+    DATASET_VERSION_CHECK_INTERVAL = 5
+    # 全文索引无结果时是否退回 LIKE 全表扫描（30 万行，代价很高）
+    SEARCH_LIKE_FALLBACK = False
+    
+    # ASGI 入口（asgi.py）的线程池大小：搜索和其他请求使用独立的线程池
+    ASGI_SEARCH_THREADS = 4
+    ASGI_LOOKUP_THREADS = 16
+    
+    # HTTP 缓存：只读页面和接口按数据版本号生成 ETag，支持条件请求（304）
+    HTTP_CACHE_ENABLED = True
+    HTTP_CACHE_MAX_AGE = 300                     # 浏览器和 CDN 直接使用缓存的时间（秒）
+    HTTP_CACHE_STALE_WHILE_REVALIDATE = 86400    # 过期后可先返回旧内容、后台重新验证的时间（秒），0 为不启用
+    # 参与 ETag 计算的附加字符串，部署修改了模板或接口格式的新版本时更换，使客户端缓存失效
+    HTTP_CACHE_ETAG_SALT = os.environ.get('HTTP_CACHE_ETAG_SALT', '')
+
+    # 运行指标（/metrics）：路由耗时、每个请求的 SQL 语句数和耗时、搜索方式、缓存命中率、连接数，默认关闭
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+    # 设置后 /metrics 需要 Authorization: Bearer <METRICS_TOKEN>
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    # 多个 worker 进程汇总指标的目录（每个进程定期写入一个文件，/metrics 汇总全部进程），
+    # 为空时只输出处理该请求的进程的指标；服务每次启动时应为空目录
+    METRICS_DIR = os.environ.get('METRICS_DIR') or None
+    METRICS_FLUSH_INTERVAL = 1   # 每个进程写入指标文件的间隔（秒）
+    # 响应中添加 Server-Timing 头（SQL 耗时和语句数、总耗时），会暴露服务端耗时，默认关闭
+    SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', '0') == '1'
+
+    # 慢查询日志：请求中超过阈值（毫秒）的 SQL 语句连同参数和 EXPLAIN QUERY PLAN 写入日志，0 为关闭（默认）
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '0'))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG') or os.path.join(os.path.dirname(__file__), 'logs', 'slow_queries.log')
+    SLOW_QUERY_SAMPLE_RATE = 1.0        # 抽样比例（0 - 1）
+    SLOW_QUERY_MAX_PER_MINUTE = 60      # 每个进程每分钟最多记录的条数
 
 class DevelopmentConfig(Config):
     """开发环境配置"""
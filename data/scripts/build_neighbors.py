@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+计算相似诗词，写入 poem_neighbors 表（诗词详情页和 /api/poems/<id>/similar 使用）
+
+相似度为正文字二元组（相邻两字）集合的 Jaccard 相似度，用 MinHash 估计：
+- 每首诗词的二元组集合经 bands × rows 个哈希函数取最小值，得到 MinHash 签名；
+  签名由进程池按块并行计算，每块用 NumPy 矩阵运算一次完成
+- LSH：签名分为 bands 段，某一段完全相同的诗词互为候选；
+  超过 --max-bucket 首的桶来自“不知”“何处”这类常用词，没有区分度，直接跳过
+- 候选对按签名相同的比例估计相似度，每首诗词保留最相似的 k 首
+  （估计值为 1 的视为同一首诗词的重复收录，不作为相似诗词）
+
+数据导入后运行一次即可，导入数据时会清除失效的结果。
+默认在当前数据库的新快照中写入，完成后原子切换，运行中的网站无需重启。
+
+用法：
+    python data/scripts/build_neighbors.py
+    python data/scripts/build_neighbors.py --k 10 --bands 32 --rows 2 --workers 4
+    python data/scripts/build_neighbors.py --in-place   # 直接写入当前数据库
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import Config
+from database import init_db, bump_dataset_version, SnapshotBuild
+
+# 每块计算签名的诗词数（块内的哈希矩阵约为 哈希数 × 二元组数 × 8 字节）
+CHUNK_SIZE = 1000
+# 每次比较的候选对数
+SCORE_BATCH_SIZE = 200_000
+# 没有二元组（单字、空内容）的诗词的签名值
+EMPTY = np.uint32(0xFFFFFFFF)
+
+def shingles(content):
+    """正文中同一短句内相邻两字组成的二元组，编码为整数"""
+    codes = set()
+    previous = None
+    for ch in content:
+        if ch.isalnum():
+            if previous is not None:
+                codes.add((ord(previous) << 21) | ord(ch))
+            previous = ch
+        else:
+            previous = None
+    return codes
+
+def hash_coefficients(num_perm, seed):
+    """multiply-shift 哈希的系数（a 为奇数），各进程由同一种子生成"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+def signature_chunk(rows, num_perm, seed):
+    """计算一块诗词的 MinHash 签名，返回 (ids, 签名矩阵)"""
+    a, b = hash_coefficients(num_perm, seed)
+    ids = np.array([poem_id for poem_id, _ in rows], dtype=np.int64)
+    signatures = np.full((len(rows), num_perm), EMPTY, dtype=np.uint32)
+
+    sets = [shingles(content) for _, content in rows]
+    nonempty = np.array([i for i, codes in enumerate(sets) if codes], dtype=np.int64)
+    if not len(nonempty):
+        return ids, signatures
+
+    lengths = np.array([len(sets[i]) for i in nonempty])
+    values = np.fromiter((code for i in nonempty for code in sets[i]), dtype=np.uint64,
+                         count=int(lengths.sum()))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # (哈希数, 二元组数) 的哈希矩阵，按诗词分段取最小值（uint64 乘法溢出即为取模）
+    hashed = ((a[:, None] * values[None, :] + b[:, None]) >> np.uint64(32)).astype(np.uint32)
+    signatures[nonempty] = np.minimum.reduceat(hashed, offsets, axis=1).T
+    return ids, signatures
+
+def iter_chunks(cursor):
+    """按 id 分块流式读取诗词正文"""
+    last_id = 0
+    while True:
+        cursor.execute('SELECT id, content FROM poems WHERE id > ? ORDER BY id LIMIT ?',
+                       (last_id, CHUNK_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+def compute_signatures(conn, num_perm, seed, workers):
+    """进程池并行计算全部诗词的签名，返回按 id 排序的 (ids, 签名矩阵)"""
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        chunks = iter_chunks(conn.cursor())
+        exhausted = False
+
+        while pending or not exhausted:
+            # 同时在途的任务数有上限，避免把所有诗词读入内存
+            while not exhausted and len(pending) < workers * 2:
+                rows = next(chunks, None)
+                if rows is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(signature_chunk, rows, num_perm, seed))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+            print(f'  已计算 {sum(len(ids) for ids, _ in results)} 首', end='\r')
+
+    results.sort(key=lambda result: result[0][0])
+    return (np.concatenate([ids for ids, _ in results]),
+            np.concatenate([signatures for _, signatures in results]))
+
+def candidate_pairs(signatures, bands, rows, max_bucket):
+    """LSH：任意一段签名相同的诗词对（下标 i < j），返回编码为 i * n + j 的有序数组"""
+    n = len(signatures)
+    valid = np.flatnonzero(signatures[:, 0] != EMPTY)
+    pairs = np.empty(0, dtype=np.int64)
+
+    for band in range(bands):
+        # 一段签名合并为一个 64 位键（乘法溢出即为取模）
+        keys = np.zeros(len(valid), dtype=np.uint64)
+        for column in signatures[valid, band * rows:(band + 1) * rows].T:
+            keys = keys * np.uint64(0x9E3779B97F4A7C15) + column.astype(np.uint64)
+
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        sizes = np.diff(np.concatenate((starts, [len(order)])))
+
+        # 同样大小的桶一起展开为诗词对
+        band_pairs = []
+        for size in np.unique(sizes[(sizes >= 2) & (sizes <= max_bucket)]):
+            members = valid[order[starts[sizes == size][:, None] + np.arange(size)]]
+            left, right = np.triu_indices(size, 1)
+            i = np.minimum(members[:, left], members[:, right]).ravel()
+            j = np.maximum(members[:, left], members[:, right]).ravel()
+            band_pairs.append(i * n + j)
+        if band_pairs:
+            pairs = np.union1d(pairs, np.concatenate(band_pairs))
+    return pairs
+
+def top_neighbors(signatures, pairs, k, min_score):
+    """估计候选对的相似度，每首诗词保留最相似的 k 首，返回 (i, j, score, rank)"""
+    n = len(signatures)
+    sources, targets, scores = [], [], []
+    for start in range(0, len(pairs), SCORE_BATCH_SIZE):
+        batch = pairs[start:start + SCORE_BATCH_SIZE]
+        i, j = batch // n, batch % n
+        score = (signatures[i] == signatures[j]).mean(axis=1, dtype=np.float32)
+        keep = (score >= min_score) & (score < 1.0)
+        # 相似关系是对称的，两个方向都保留
+        sources += [i[keep], j[keep]]
+        targets += [j[keep], i[keep]]
+        scores += [score[keep], score[keep]]
+
+    if not sources:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32), empty
+
+    i, j, score = np.concatenate(sources), np.concatenate(targets), np.concatenate(scores)
+    # 按诗词分组、组内按相似度从高到低排序，相同时按 id 排序
+    order = np.lexsort((j, -score, i))
+    i, j, score = i[order], j[order], score[order]
+    starts = np.flatnonzero(np.concatenate(([True], i[1:] != i[:-1])))
+    rank = np.arange(len(i)) - np.repeat(starts, np.diff(np.concatenate((starts, [len(i)]))))
+    keep = rank < k
+    return i[keep], j[keep], score[keep], rank[keep]
+
+def build_neighbors(k=None, bands=32, rows=2, max_bucket=200, min_score=0.1, seed=1, workers=None,
+                    in_place=False):
+    """计算相似诗词
+
+    默认在当前数据库的副本（新快照）中写入，完成后原子切换；in_place=True 时直接写入 DATABASE_PATH。
+    """
+    print('=' * 60)
+    print('相似诗词计算工具')
+    print('=' * 60)
+
+    options = dict(k=k or Config.SIMILAR_POEMS_LIMIT, bands=bands, rows=rows, max_bucket=max_bucket,
+                   min_score=min_score, seed=seed, workers=workers or os.cpu_count() or 1)
+    if in_place:
+        write_neighbors(**options)
+        return
+
+    with SnapshotBuild(copy_current=True) as snapshot:
+        print(f'\n在新快照中计算: {snapshot.path}')
+        if write_neighbors(**options) is None:
+            snapshot.discard()
+    if not snapshot.discarded:
+        print(f'已切换到新快照: {snapshot.path}')
+
+def write_neighbors(k, bands, rows, max_bucket, min_score, seed, workers):
+    """在 Config.DATABASE_PATH 中重新计算相似诗词，返回写入的条数；诗词不足两首时返回 None"""
+    init_db()
+    conn = sqlite3.connect(Config.DATABASE_PATH)
+    cursor = conn.cursor()
+
+    started = time.perf_counter()
+    print(f'\n计算 MinHash 签名（{bands} × {rows} 个哈希函数）...')
+    cursor.execute('SELECT COUNT(*) FROM poems')
+    if cursor.fetchone()[0] < 2:
+        print('诗词数量不足，跳过')
+        conn.close()
+        return None
+    ids, signatures = compute_signatures(conn, bands * rows, seed, workers)
+    print(f'\n  {len(ids)} 首，用时 {time.perf_counter() - started:.1f} 秒')
+
+    step_started = time.perf_counter()
+    print('\n查找候选（LSH）...')
+    pairs = candidate_pairs(signatures, bands, rows, max_bucket)
+    print(f'  {len(pairs)} 对候选，用时 {time.perf_counter() - step_started:.1f} 秒')
+
+    step_started = time.perf_counter()
+    print('\n估计相似度并排序...')
+    i, j, score, rank = top_neighbors(signatures, pairs, k, min_score)
+    print(f'  {len(np.unique(i))} 首诗词有相似诗词，用时 {time.perf_counter() - step_started:.1f} 秒')
+
+    print('\n写入数据库...')
+    cursor.execute('DELETE FROM poem_neighbors')
+    cursor.executemany(
+        'INSERT INTO poem_neighbors (poem_id, rank, neighbor_id, score) VALUES (?, ?, ?, ?)',
+        zip(ids[i].tolist(), rank.tolist(), ids[j].tolist(), np.round(score.astype(np.float64), 4).tolist())
+    )
+    bump_dataset_version(conn)
+    conn.commit()
+    conn.close()
+
+    print(f'\n✅ 相似诗词计算完成！共 {len(i)} 条，用时 {time.perf_counter() - started:.1f} 秒')
+    return len(i)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='相似诗词计算工具')
+    parser.add_argument('--k', type=int, default=None,
+                        help=f'每首诗词保留的相似诗词数（默认 {Config.SIMILAR_POEMS_LIMIT}）')
+    parser.add_argument('--bands', type=int, default=32, help='LSH 段数（默认 32）')
+    parser.add_argument('--rows', type=int, default=2,
+                        help='每段的哈希数，越小候选越多、召回越高（默认 2）')
+    parser.add_argument('--max-bucket', type=int, default=200,
+                        help='跳过超过该大小的 LSH 桶（默认 200）')
+    parser.add_argument('--min-score', type=float, default=0.1,
+                        help='相似度下限（默认 0.1）')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='计算签名的进程数（默认为 CPU 核心数）')
+    parser.add_argument('--in-place', action='store_true',
+                        help='直接写入当前数据库，不使用快照')
+    args = parser.parse_args()
+
+    build_neighbors(k=args.k, bands=args.bands, rows=args.rows, max_bucket=args.max_bucket,
+                    min_score=args.min_score, workers=args.workers, in_place=args.in_place)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+将诗词导出为 NDJSON（每行一首诗词的 JSON），与 /api/export 接口的输出相同
+
+结果集从数据库游标分块读取、逐行写出，导出全部诗词时内存占用也保持不变。
+输出文件名以 .gz 结尾时自动 gzip 压缩。
+
+用法：
+    python data/scripts/export_poems.py -o poems.ndjson.gz
+    python data/scripts/export_poems.py --dynasty 唐 --author 李白 --fields title,paragraphs
+"""
+
+import argparse
+import contextlib
+import gzip
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from codec import LazyPinyin
+from database import init_db
+from models import PoemModel, POEM_FIELDS
+
+def _json_default(o):
+    """JSON 序列化时解码按需加载的拼音"""
+    if isinstance(o, LazyPinyin):
+        return o.to_list()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+def open_output(path):
+    """打开输出文件（- 表示标准输出，.gz 结尾时压缩）"""
+    if path == '-':
+        return sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+def export_poems(output, dynasty=None, author=None, fields=None):
+    """导出诗词，返回导出的数量"""
+    count = 0
+    out = open_output(output)
+    try:
+        for poem in PoemModel.iter_poems(dynasty=dynasty, author=author, fields=fields):
+            out.write(json.dumps(poem, ensure_ascii=False, default=_json_default))
+            out.write('\n')
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='将诗词导出为 NDJSON')
+    parser.add_argument('-o', '--output', default='-',
+                        help='输出文件（默认输出到标准输出，.gz 结尾时压缩）')
+    parser.add_argument('--dynasty', help='只导出该朝代的诗词')
+    parser.add_argument('--author', help='只导出该作者的诗词')
+    parser.add_argument('--fields',
+                        help=f"导出的字段，以逗号分隔（默认全部：{','.join(POEM_FIELDS)}）")
+    args = parser.parse_args()
+
+    fields = [field.strip() for field in args.fields.split(',')] if args.fields else None
+    unknown = [field for field in fields or [] if field not in POEM_FIELDS]
+    if unknown:
+        parser.error(f"未知字段: {', '.join(unknown)}")
+
+    # 初始化信息输出到标准错误，不混入导出内容
+    with contextlib.redirect_stdout(sys.stderr):
+        init_db()
+    count = export_poems(args.output, dynasty=args.dynasty, author=args.author, fields=fields)
+    print(f'✅ 导出完成，共 {count} 首诗词', file=sys.stderr)
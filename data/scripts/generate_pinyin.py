@@ -2,11 +2,22 @@
 """
 为诗词生成拼音
 使用 pypinyin 库自动为所有诗词的每一句生成拼音
+
+- 默认只处理还没有拼音的诗词（新导入或内容变化后被清空的），--all 全部重新生成
+- 同时生成无声调的拼音搜索字段（pinyin_text）并写入拼音全文索引，供拼音搜索使用
+- 诗词按 id 分块流式读取，由进程池并行生成，主进程用 executemany 批量写入
+- 每句按标点切分为短句，短句的拼音结果在进程内缓存（古诗词中常用短句大量重复）
+- 默认在当前数据库的新快照中生成，完成后原子切换，运行中的网站无需重启
 """
 
-import json
+import argparse
+import functools
+import os
+import re
 import sqlite3
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from pypinyin import pinyin, Style
 
@@ -14,40 +25,77 @@ from pypinyin import pinyin, Style
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from config import Config
+from database import (init_db, refresh_aggregates, bump_dataset_version, migrate_storage,
+                      load_syllable_ids, add_syllables, pinyin_search_text,
+                      pinyin_fts_insert, pinyin_fts_delete, SnapshotBuild)
+from codec import decode_paragraphs, encode_pinyin
 
-def generate_pinyin_for_text(text):
-    """为文本生成拼音"""
+# 每个任务处理的诗词数
+CHUNK_SIZE = 2000
+
+# 需要生成拼音的诗词：没有拼音，或还没有拼音搜索字段（旧版本生成的）
+PENDING_CONDITION = "(pinyin IS NULL OR pinyin = '' OR pinyin_text IS NULL)"
+
+# 按连续汉字切分文本；pypinyin 的分词不会跨越非汉字字符，切分后结果与整句相同
+HAN_SPLIT_PATTERN = re.compile(r'([^㐀-鿿\U00020000-\U0002ffff]+)')
+
+@functools.lru_cache(maxsize=200000)
+def _pinyin_for_segment(segment):
+    """为一段连续汉字（或一段非汉字字符）生成拼音，结果缓存"""
     # 使用带声调的拼音
-    result = pinyin(text, style=Style.TONE, heteronym=False)
+    result = pinyin(segment, style=Style.TONE, heteronym=False)
     # 将结果扁平化为字符串列表
-    return [item[0] for item in result]
+    return tuple(item[0] for item in result)
+
+def generate_pinyin_for_text(text):
+    """为文本生成拼音"""
+    syllables = []
+    for segment in HAN_SPLIT_PATTERN.split(text):
+        if segment:
+            syllables.extend(_pinyin_for_segment(segment))
+    return syllables
 
 def generate_pinyin_for_poem(paragraphs):
     """为诗词的每一句生成拼音"""
     if not paragraphs:
         return []
-    
+
     pinyin_list = []
     for line in paragraphs:
         # 为每一句生成拼音
         line_pinyin = generate_pinyin_for_text(line)
         pinyin_list.append(line_pinyin)
-    
+
     return pinyin_list
 
+def generate_chunk(rows):
+    """为一批诗词生成拼音（在子进程中运行），返回 [(id, 每句拼音)] 和出错信息"""
+    results = []
+    errors = []
+    for poem_id, content, line_offsets in rows:
+        try:
+            # 还原诗句
+            paragraphs = decode_paragraphs(content, line_offsets)
+
+            # 生成拼音
+            results.append((poem_id, generate_pinyin_for_poem(paragraphs)))
+        except Exception as e:
+            errors.append(f'处理诗词 ID {poem_id} 时出错: {e}')
+    return results, errors
+
 def add_pinyin_column():
     """添加 pinyin 字段到数据库"""
     conn = sqlite3.connect(Config.DATABASE_PATH)
     cursor = conn.cursor()
-    
+
     try:
         # 检查字段是否已存在
         cursor.execute("PRAGMA table_info(poems)")
         columns = [column[1] for column in cursor.fetchall()]
-        
+
         if 'pinyin' not in columns:
             print('添加 pinyin 字段到数据库...')
-            cursor.execute('ALTER TABLE poems ADD COLUMN pinyin TEXT')
+            cursor.execute('ALTER TABLE poems ADD COLUMN pinyin BLOB')
             conn.commit()
             print('✅ 字段添加成功')
         else:
@@ -57,80 +105,162 @@ def add_pinyin_column():
     finally:
         conn.close()
 
-def generate_all_pinyin():
-    """为所有诗词生成拼音"""
+def iter_chunks(cursor, regenerate_all):
+    """按 id 分块流式读取待处理的诗词"""
+    condition = '' if regenerate_all else f'AND {PENDING_CONDITION}'
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT id, content, line_offsets FROM poems
+            WHERE id > ? {condition}
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, CHUNK_SIZE))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+def generate_all_pinyin(regenerate_all=False, workers=None, in_place=False):
+    """为诗词生成拼音
+
+    regenerate_all=False 时只处理 pinyin 或 pinyin_text 为空的诗词。
+    默认在当前数据库的副本（新快照）中生成，完成后原子切换；in_place=True 时直接写入 DATABASE_PATH。
+    """
     print('=' * 60)
     print('诗词拼音生成工具')
     print('=' * 60)
-    
-    # 确保 pinyin 字段存在
+
+    if in_place:
+        write_pinyin(regenerate_all, workers)
+        return
+
+    if not regenerate_all and count_pending(Config.DATABASE_PATH) == 0:
+        # 定时运行时大多没有待处理的诗词，不必复制数据库
+        print('\n总共 0 首诗词需要生成拼音')
+        return
+
+    with SnapshotBuild(copy_current=True) as snapshot:
+        print(f'\n在新快照中生成: {snapshot.path}')
+        if not write_pinyin(regenerate_all, workers):
+            snapshot.discard()
+    if not snapshot.discarded:
+        print(f'已切换到新快照: {snapshot.path}')
+
+def count_pending(path):
+    """还没有拼音的诗词数量，无法判断（数据库不存在、表结构较旧）时返回 None"""
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f'SELECT COUNT(*) FROM poems WHERE {PENDING_CONDITION}').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+def write_pinyin(regenerate_all, workers):
+    """在 Config.DATABASE_PATH 中生成拼音，返回处理的诗词数"""
+    # 确保表结构为最新（音节表、紧凑格式），pinyin 字段存在
+    init_db()
     add_pinyin_column()
-    
+
     # 连接数据库
     conn = sqlite3.connect(Config.DATABASE_PATH)
     cursor = conn.cursor()
-    
-    # 获取总数
-    cursor.execute('SELECT COUNT(*) FROM poems')
+    migrate_storage(conn)
+    syllable_ids = load_syllable_ids(cursor)
+
+    # 统计待处理数量
+    if regenerate_all:
+        cursor.execute('SELECT COUNT(*) FROM poems')
+    else:
+        cursor.execute(f'SELECT COUNT(*) FROM poems WHERE {PENDING_CONDITION}')
     total = cursor.fetchone()[0]
     print(f'\n总共 {total} 首诗词需要生成拼音')
-    
-    # 检查已有拼音的数量
-    cursor.execute('SELECT COUNT(*) FROM poems WHERE pinyin IS NOT NULL AND pinyin != ""')
-    existing = cursor.fetchone()[0]
-    
-    if existing > 0:
-        response = input(f'\n已有 {existing} 首诗词包含拼音，是否重新生成？(y/N): ')
-        if response.lower() != 'y':
-            print('取消生成')
-            conn.close()
-            return
-    
+
+    if total == 0:
+        conn.close()
+        return 0
+
     print('\n开始生成拼音...')
-    
-    # 获取所有诗词
-    cursor.execute('SELECT id, paragraphs FROM poems')
-    all_poems = cursor.fetchall()
-    
+
     processed = 0
-    
-    for row in all_poems:
-        poem_id, paragraphs_json = row
-        
-        try:
-            # 解析 paragraphs
-            paragraphs = json.loads(paragraphs_json) if paragraphs_json else []
-            
-            # 生成拼音
-            pinyin_data = generate_pinyin_for_poem(paragraphs)
-            
-            # 保存到数据库
-            cursor.execute(
-                'UPDATE poems SET pinyin = ? WHERE id = ?',
-                (json.dumps(pinyin_data, ensure_ascii=False), poem_id)
-            )
-            
-            processed += 1
-            
-            # 显示进度
-            if processed % 100 == 0:
-                progress = (processed / total) * 100
-                print(f'  进度: {processed}/{total} ({progress:.1f}%)', end='\r')
-            
-            # 每1000条提交一次
-            if processed % 1000 == 0:
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        chunks = iter_chunks(conn.cursor(), regenerate_all)
+        exhausted = False
+
+        while pending or not exhausted:
+            # 同时在途的任务数有上限，避免把所有诗词读入内存
+            while not exhausted and len(pending) < workers * 2:
+                rows = next(chunks, None)
+                if rows is None:
+                    exhausted = True
+                else:
+                    pending.add(executor.submit(generate_chunk, rows))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, errors = future.result()
+                for error in errors:
+                    print(f'\n  警告: {error}')
+
+                # 重新生成的诗词先从拼音全文索引中移除旧值
+                ids = [poem_id for poem_id, _ in results]
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    cursor.execute(f'''
+                        SELECT id, pinyin_text FROM poems
+                        WHERE id IN ({placeholders}) AND pinyin_text IS NOT NULL
+                    ''', chunk)
+                    pinyin_fts_delete(cursor, cursor.fetchall())
+
+                # 新音节写入音节表，拼音编码为音节 id 数组后保存到数据库
+                add_syllables(cursor, syllable_ids,
+                              {syllable for _, lines in results for line in lines for syllable in line})
+                search_texts = [(poem_id, pinyin_search_text(lines)) for poem_id, lines in results]
+                cursor.executemany('UPDATE poems SET pinyin = ?, pinyin_text = ? WHERE id = ?', [
+                    (encode_pinyin(lines, syllable_ids), text, poem_id)
+                    for (poem_id, lines), (_, text) in zip(results, search_texts)
+                ])
+                pinyin_fts_insert(cursor, search_texts)
                 conn.commit()
-        
-        except Exception as e:
-            print(f'\n  警告: 处理诗词 ID {poem_id} 时出错: {e}')
-    
-    # 最后提交
+                processed += len(results)
+
+            # 显示进度
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            progress = (processed / total) * 100
+            print(f'  进度: {processed}/{total} ({progress:.1f}%), {processed / elapsed:.0f} 首/秒',
+                  end='\r')
+
+    # 刷新统计表
+    refresh_aggregates(conn)
+    bump_dataset_version(conn)
     conn.commit()
-    
-    print(f'\n\n✅ 拼音生成完成！')
+
+    print(f'\n\n✅ 拼音生成完成！用时 {time.perf_counter() - started:.1f} 秒')
     print(f'成功处理: {processed} 首诗词')
-    
+
     conn.close()
+    return processed
 
 if __name__ == '__main__':
-    generate_all_pinyin()
+    parser = argparse.ArgumentParser(description='诗词拼音生成工具')
+    parser.add_argument('--all', action='store_true',
+                        help='为所有诗词重新生成拼音（默认只处理没有拼音的诗词）')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='生成拼音的进程数（默认为 CPU 核心数）')
+    parser.add_argument('--in-place', action='store_true',
+                        help='直接写入当前数据库，不使用快照')
+    args = parser.parse_args()
+
+    generate_all_pinyin(regenerate_all=args.all, workers=args.workers, in_place=args.in_place)
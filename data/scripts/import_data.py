@@ -2,263 +2,536 @@
 """
 古诗词数据导入脚本
 从 chinese-poetry 项目导入诗词数据到 SQLite 数据库
+
+导入流程为流水线：
+1. 进程池并行解析、规整 JSON 文件
+2. 主进程作为唯一写入者，用 executemany 在大事务中批量写入
+   （导入期间关闭日志和同步，删除二级索引）
+3. 数据写入完成后再建立索引和全文索引
+
+使用 --incremental 时不清空数据，按内容哈希只写入新增、变化和删除的诗词，
+可以无人值守地定时运行；数据源缺少目录或有文件解析失败时放弃本次导入（退出码为 1），
+不会把这些文件中的诗词当作已删除。
+
+默认在 data/snapshots 中的新数据库快照里导入，完成后原子切换 data/poetry.db（符号链接），
+运行中的网站无需重启；回滚见 data/scripts/snapshots.py。
 """
 
+import argparse
+import hashlib
 import json
+import os
 import sqlite3
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from database import init_db
+from database import (init_db, rebuild_fts, refresh_aggregates, bump_dataset_version,
+                      create_indexes, drop_indexes, fts_insert, fts_delete, migrate_storage,
+                      pinyin_fts_delete, SnapshotBuild)
+from codec import encode_line_offsets, make_excerpt
 from config import Config
 
-def import_poems():
-    """导入诗词数据"""
-    
-    # 初始化数据库
-    print('初始化数据库...')
-    init_db()
-    
-    # 连接数据库
-    conn = sqlite3.connect(Config.DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # 检查是否已有数据
-    cursor.execute('SELECT COUNT(*) FROM poems')
-    existing_count = cursor.fetchone()[0]
-    
-    if existing_count > 0:
-        response = input(f'数据库中已有 {existing_count} 首诗词，是否清空重新导入？(y/N): ')
-        if response.lower() == 'y':
-            print('清空现有数据...')
-            cursor.execute('DELETE FROM poems')
-            cursor.execute('DELETE FROM poems_fts')
-            conn.commit()
-        else:
-            print('取消导入')
-            conn.close()
-            return
-    
+# 数据源：(名称, 相对 chinese-poetry 的路径, 朝代, 文件匹配模式；None 表示单个文件)
+SOURCES = [
+    ('唐诗', '全唐诗', '唐', 'poet.tang.*.json'),
+    ('宋诗', '全宋诗', '宋', 'poet.song.*.json'),
+    ('宋词', '宋词', '宋', 'ci.song.*.json'),
+    ('元曲', '元曲', '元', '*.json'),
+    ('诗经', '诗经/shijing.json', '先秦', None),
+    ('楚辞', '楚辞/chuci.json', '先秦', None),
+    ('曹操诗集', '曹操诗集/caocao.json', '魏晋', None),  # 曹操属于东汉末/三国时期
+    ('花间集', '五代诗词/huajianji', '五代', '*.json'),
+    ('南唐诗词', '五代诗词/nantang', '五代', '*.json'),
+    ('纳兰性德', '纳兰性德/纳兰性德诗集.json', '清', None),
+]
+
+INSERT_SQL = '''
+    INSERT INTO poems (title, author, dynasty, content, line_offsets, tags, is_untitled,
+                       excerpt, content_hash, poem_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+UPDATE_SQL = '''
+    UPDATE poems
+    SET title = ?, author = ?, dynasty = ?, content = ?, line_offsets = ?, tags = ?,
+        is_untitled = ?, excerpt = ?, content_hash = ?
+    WHERE id = ?
+'''
+
+# 每个事务写入的行数
+BATCH_SIZE = 50000
+
+class SourceError(Exception):
+    """数据源不完整（目录缺失或文件解析失败），增量导入无法判断哪些诗词已被删除"""
+
+def import_poems(workers=None, incremental=False, assume_yes=False, in_place=False):
+    """导入诗词数据
+
+    incremental=True 时按 poem_key / content_hash 与现有数据比对，只写入有变化的诗词；
+    否则清空后全量导入（assume_yes=True 时不询问确认，适合定时任务）。
+
+    默认在新的数据库快照中导入（增量导入时先复制当前数据库），完成后原子切换，
+    导入期间网站读到的始终是导入前的完整数据；in_place=True 时直接写入 DATABASE_PATH。
+    """
+
     # 数据源目录
     raw_dir = Path(__file__).parent.parent / 'raw' / 'chinese-poetry'
-    
+
     if not raw_dir.exists():
         print(f'错误: 数据源目录不存在: {raw_dir}')
         print('\n请先下载 chinese-poetry 数据:')
         print('  cd data')
         print('  git clone https://github.com/chinese-poetry/chinese-poetry.git raw/chinese-poetry')
-        conn.close()
         return
-    
-    total_count = 0
-    
-    # 导入唐诗
-    tang_dir = raw_dir / '全唐诗'
-    if tang_dir.exists():
-        print('\n开始导入唐诗...')
-        count = import_from_directory(cursor, tang_dir, '唐', 'poet.tang.*.json')
-        total_count += count
-        print(f'唐诗导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入宋诗
-    song_dir = raw_dir / '全宋诗'
-    if song_dir.exists():
-        print('\n开始导入宋诗...')
-        count = import_from_directory(cursor, song_dir, '宋', 'poet.song.*.json')
-        total_count += count
-        print(f'宋诗导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入宋词
-    songci_dir = raw_dir / '宋词'
-    if songci_dir.exists():
-        print('\n开始导入宋词...')
-        count = import_from_directory(cursor, songci_dir, '宋', 'ci.song.*.json')
-        total_count += count
-        print(f'宋词导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入元曲
-    yuanqu_dir = raw_dir / '元曲'
-    if yuanqu_dir.exists():
-        print('\n开始导入元曲...')
-        count = import_from_directory(cursor, yuanqu_dir, '元', '*.json')
-        total_count += count
-        print(f'元曲导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入诗经
-    shijing_file = raw_dir / '诗经' / 'shijing.json'
-    if shijing_file.exists():
-        print('\n开始导入诗经...')
-        count = import_from_file(cursor, shijing_file, '先秦')
-        total_count += count
-        print(f'诗经导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入楚辞
-    chuci_file = raw_dir / '楚辞' / 'chuci.json'
-    if chuci_file.exists():
-        print('\n开始导入楚辞...')
-        count = import_from_file(cursor, chuci_file, '先秦')
-        total_count += count
-        print(f'楚辞导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入曹操诗集
-    caocao_file = raw_dir / '曹操诗集' / 'caocao.json'
-    if caocao_file.exists():
-        print('\n开始导入曹操诗集...')
-        count = import_from_file(cursor, caocao_file, '魏晋')  # 曹操属于东汉末/三国时期
-        total_count += count
-        print(f'曹操诗集导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入五代诗词 - 花间集
-    huajianji_dir = raw_dir / '五代诗词' / 'huajianji'
-    if huajianji_dir.exists():
-        print('\n开始导入五代诗词（花间集）...')
-        count = import_from_directory(cursor, huajianji_dir, '五代', '*.json')
-        total_count += count
-        print(f'花间集导入完成: {count} 首')
-        conn.commit()
-    
-    # 导入五代诗词 - 南唐
-    nantang_dir = raw_dir / '五代诗词' / 'nantang'
-    if nantang_dir.exists():
-        print('\n开始导入五代诗词（南唐）...')
-        count = import_from_directory(cursor, nantang_dir, '五代', '*.json')
-        total_count += count
-        print(f'南唐诗词导入完成: {count} 首')
+
+    files = collect_files(raw_dir)
+    if not files:
+        print('错误: 数据源目录中没有可导入的文件')
+        return
+
+    # 增量导入时缺少的数据源会被当作整体删除
+    missing = missing_sources(raw_dir)
+    if incremental and missing:
+        raise SourceError(f'数据源缺失: {"、".join(missing)}')
+
+    # 检查是否已有数据
+    existing_count = count_poems(Config.DATABASE_PATH)
+
+    if existing_count > 0 and not incremental and not assume_yes:
+        response = input(f'数据库中已有 {existing_count} 首诗词，是否清空重新导入？(y/N): ')
+        if response.lower() != 'y':
+            print('取消导入')
+            return
+
+    if in_place:
+        run_import(files, workers, incremental, clear=existing_count > 0)
+        return
+
+    # 全量导入从空数据库开始，不需要复制当前数据库
+    with SnapshotBuild(copy_current=incremental) as snapshot:
+        print(f'在新快照中导入: {snapshot.path}')
+        if not run_import(files, workers, incremental, clear=False):
+            snapshot.discard()
+    if not snapshot.discarded:
+        print(f'已切换到新快照: {snapshot.path}')
+
+def count_poems(path):
+    """数据库中的诗词数量，数据库或 poems 表不存在时为 0"""
+    if not os.path.exists(path):
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM poems').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+def run_import(files, workers, incremental, clear):
+    """在 Config.DATABASE_PATH 中导入，返回数据是否有变化"""
+
+    # 初始化数据库
+    print('初始化数据库...')
+    init_db()
+
+    # 连接数据库
+    conn = sqlite3.connect(Config.DATABASE_PATH)
+    cursor = conn.cursor()
+
+    started = time.perf_counter()
+
+    if incremental:
+        changed = sync_poems(conn, files, workers)
+    else:
+        full_import(conn, files, workers, clear=clear)
+        changed = True
+
+    if changed:
+        # 刷新作者、朝代统计表
+        print('更新统计信息...')
+        refresh_aggregates(conn)
+        bump_dataset_version(conn)
         conn.commit()
-    
-    # 导入纳兰性德
-    nalan_file = raw_dir / '纳兰性德' / '纳兰性德诗集.json'
-    if nalan_file.exists():
-        print('\n开始导入纳兰性德...')
-        count = import_from_file(cursor, nalan_file, '清')
-        total_count += count
-        print(f'纳兰性德导入完成: {count} 首')
+
+    elapsed = time.perf_counter() - started
+    print(f'\n✅ 数据导入完成！用时 {elapsed:.1f} 秒')
+
+    # 显示统计信息
+    for key, label in [('total_poems', '诗词总数'), ('total_authors', '作者数量'),
+                       ('total_dynasties', '朝代数量')]:
+        cursor.execute('SELECT value FROM meta WHERE key = ?', (key,))
+        print(f'{label}: {cursor.fetchone()[0]}')
+
+    conn.close()
+    return changed
+
+def full_import(conn, files, workers, clear):
+    """清空后全量导入"""
+    cursor = conn.cursor()
+
+    # 批量导入期间关闭日志和同步，删除二级索引，导入结束后恢复
+    print('\n准备批量写入...')
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    drop_indexes(cursor)
+
+    if clear:
+        print('清空现有数据...')
+        cursor.execute('DELETE FROM poems')
+        cursor.execute("INSERT INTO poems_fts(poems_fts) VALUES('delete-all')")
+        cursor.execute("INSERT INTO poems_pinyin_fts(poems_pinyin_fts) VALUES('delete-all')")
+        cursor.execute('DELETE FROM poem_neighbors')
+    conn.commit()
+
+    # 旧版本数据库的表结构升级为紧凑格式（数据已清空，无需逐行转换）
+    migrate_storage(conn)
+
+    pending = []
+    for row in iter_poem_rows(files, workers):
+        pending.append(row)
+        if len(pending) >= BATCH_SIZE:
+            cursor.executemany(INSERT_SQL, pending)
+            conn.commit()
+            pending = []
+
+    if pending:
+        cursor.executemany(INSERT_SQL, pending)
         conn.commit()
-    
+
+    # 建立索引
+    print('\n建立索引...')
+    index_started = time.perf_counter()
+    create_indexes(cursor)
+    conn.commit()
+    print(f'  用时 {time.perf_counter() - index_started:.1f} 秒')
+
     # 构建全文搜索索引
     print('\n构建全文搜索索引...')
+    index_started = time.perf_counter()
+    rebuild_fts(conn)
+    conn.commit()
+    print(f'  用时 {time.perf_counter() - index_started:.1f} 秒')
+
+    cursor.execute('PRAGMA synchronous = NORMAL')
+    cursor.execute('PRAGMA journal_mode = WAL')
+
+def sync_poems(conn, files, workers):
+    """增量导入：新增、更新、删除有变化的诗词，并同步修补全文索引
+
+    返回是否有数据变化。
+    """
+    cursor = conn.cursor()
+
+    # 旧版本数据库先转换为紧凑格式
+    migrate_storage(conn)
+
+    # 现有数据：poem_key -> (id, content_hash)
+    cursor.execute('SELECT poem_key, id, content_hash FROM poems WHERE poem_key IS NOT NULL')
+    existing = {key: (poem_id, content_hash) for key, poem_id, content_hash in cursor}
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM poems')
+    max_id = cursor.fetchone()[0]
+
+    inserts = []
+    updates = []
+    seen = set()
+
+    for row in iter_poem_rows(files, workers, strict=True):
+        key, content_hash = row[-1], row[-2]
+        seen.add(key)
+        current = existing.get(key)
+        if current is None:
+            inserts.append(row)
+        elif current[1] != content_hash:
+            updates.append(row[:-1] + (current[0],))
+
+    deleted_ids = [poem_id for key, (poem_id, _) in existing.items() if key not in seen]
+
+    # 旧版本导入的数据没有 poem_key：与数据源中的诗词对应后原地补上，诗词 id（详情页地址）、
+    # 拼音和相似诗词保持不变；对应不上的才删除
+    inserts, backfills, legacy_updates, legacy_deleted = match_legacy_rows(cursor, inserts)
+    updates += legacy_updates
+    deleted_ids += legacy_deleted
+    if backfills:
+        cursor.executemany('UPDATE poems SET poem_key = ?, content_hash = ? WHERE id = ?', backfills)
+        print(f'\n为 {len(backfills)} 首旧数据补充了 poem_key')
+
+    print(f'\n新增 {len(inserts)} 首，更新 {len(updates)} 首，删除 {len(deleted_ids)} 首')
+    if not (inserts or updates or deleted_ids):
+        conn.commit()
+        return bool(backfills)
+
+    # 更新、删除的诗词先从全文索引中移除（无内容索引需要提供原始值）
+    stale_ids = [row[-1] for row in updates] + deleted_ids
+    for start in range(0, len(stale_ids), 500):
+        chunk = stale_ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT id, title, author, content FROM poems WHERE id IN ({placeholders})',
+                       chunk)
+        fts_delete(cursor, cursor.fetchall())
+        cursor.execute(f'''
+            SELECT id, pinyin_text FROM poems
+            WHERE id IN ({placeholders}) AND pinyin_text IS NOT NULL
+        ''', chunk)
+        pinyin_fts_delete(cursor, cursor.fetchall())
+
+    cursor.executemany('DELETE FROM poems WHERE id = ?', [(poem_id,) for poem_id in deleted_ids])
+    cursor.executemany(UPDATE_SQL, updates)
+
+    # 内容变化、被删除的诗词的相似诗词失效（重新运行 build_neighbors.py 计算）
+    cursor.executemany('DELETE FROM poem_neighbors WHERE poem_id = ?', [(poem_id,) for poem_id in stale_ids])
+    if deleted_ids:
+        cursor.execute('DELETE FROM poem_neighbors WHERE neighbor_id NOT IN (SELECT id FROM poems)')
+
+    # 内容变化后拼音需要重新生成（拼音全文索引中的旧值已在上面移除）
+    cursor.executemany('UPDATE poems SET pinyin = NULL, pinyin_text = NULL WHERE id = ?',
+                       [(row[-1],) for row in updates])
+
+    for start in range(0, len(inserts), BATCH_SIZE):
+        cursor.executemany(INSERT_SQL, inserts[start:start + BATCH_SIZE])
+
+    # 新增、更新的诗词写入全文索引
+    cursor.execute('SELECT id, title, author, content FROM poems WHERE id > ?', (max_id,))
+    new_rows = cursor.fetchall()
+    fts_insert(cursor, new_rows)
+    fts_insert(cursor, [(row[-1], row[0], row[1], row[3]) for row in updates])
+
+    conn.commit()
+    return True
+
+def match_legacy_rows(cursor, rows):
+    """把数据源中的新诗词与没有 poem_key 的旧数据对应起来
+
+    先按标题、作者、朝代和正文完全相同对应，再按标题、作者、朝代依次对应（正文有变化，作为更新）。
+    返回（仍需新增的行, 补充 poem_key 的 (poem_key, content_hash, id), 更新的行, 删除的 id）。
+    """
     cursor.execute('''
-        INSERT INTO poems_fts(rowid, title, author, content)
-        SELECT id, title, author, content FROM poems
+        SELECT id, title, author, dynasty, content FROM poems
+        WHERE poem_key IS NULL ORDER BY id DESC
     ''')
-    conn.commit()
-    
-    print(f'\n✅ 数据导入完成！')
-    print(f'总计导入: {total_count} 首诗词')
-    
-    # 显示统计信息
-    cursor.execute('SELECT COUNT(DISTINCT author) FROM poems')
-    author_count = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(DISTINCT dynasty) FROM poems')
-    dynasty_count = cursor.fetchone()[0]
-    
-    print(f'作者数量: {author_count}')
-    print(f'朝代数量: {dynasty_count}')
-    
-    conn.close()
+    legacy_ids = []
+    exact = {}
+    by_title = {}
+    for poem_id, title, author, dynasty, content in cursor:
+        legacy_ids.append(poem_id)
+        exact.setdefault((title, author, dynasty, content), []).append(poem_id)
+        by_title.setdefault((title, author, dynasty), []).append(poem_id)
+    if not legacy_ids:
+        return rows, [], [], []
+
+    used = set()
+
+    def take(candidates):
+        """按 id 从小到大取出第一个尚未对应的旧数据"""
+        while candidates:
+            poem_id = candidates.pop()
+            if poem_id not in used:
+                used.add(poem_id)
+                return poem_id
+        return None
 
-def import_from_directory(cursor, directory, dynasty, pattern):
-    """从目录导入诗词"""
-    count = 0
-    files = sorted(directory.glob(pattern))
-    
-    for i, json_file in enumerate(files, 1):
-        print(f'  处理文件 [{i}/{len(files)}]: {json_file.name}', end='\r')
-        
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                poems = json.load(f)
-                
-                for poem in poems:
-                    if import_poem(cursor, poem, dynasty):
-                        count += 1
-        except Exception as e:
-            print(f'\n  警告: 处理文件 {json_file.name} 时出错: {e}')
-    
-    print()  # 换行
-    return count
-
-def import_from_file(cursor, json_file, dynasty):
-    """从单个文件导入诗词"""
-    count = 0
-    
+    backfills = []
+    unmatched = []
+    for row in rows:
+        poem_id = take(exact.get(row[:4], []))
+        if poem_id is None:
+            unmatched.append(row)
+        else:
+            backfills.append((row[-1], row[-2], poem_id))
+
+    inserts = []
+    updates = []
+    for row in unmatched:
+        poem_id = take(by_title.get(row[:3], []))
+        if poem_id is None:
+            inserts.append(row)
+        else:
+            backfills.append((row[-1], None, poem_id))
+            updates.append(row[:-1] + (poem_id,))
+
+    deleted = sorted(poem_id for poem_id in legacy_ids if poem_id not in used)
+    return inserts, backfills, updates, deleted
+
+def collect_files(raw_dir):
+    """按 SOURCES 的顺序列出所有待导入文件，返回 [(名称, 文件路径, 朝代)]"""
+    files = []
+    for name, relative_path, dynasty, pattern in SOURCES:
+        path = raw_dir / relative_path
+        if not path.exists():
+            continue
+        if pattern is None:
+            files.append((name, path, dynasty))
+        else:
+            files.extend((name, json_file, dynasty) for json_file in sorted(path.glob(pattern)))
+    return files
+
+def missing_sources(raw_dir):
+    """SOURCES 中在数据源目录里不存在的数据源名称"""
+    return [name for name, relative_path, _, _ in SOURCES if not (raw_dir / relative_path).exists()]
+
+def iter_poem_rows(files, workers=None, strict=False):
+    """并行解析文件，按文件顺序逐行产出待写入的行（末尾附加 poem_key）
+
+    poem_key 由数据源、作者、标题和同名诗词的序号组成，在上游数据更新后保持稳定。
+    文件解析失败时跳过并警告；strict=True 时抛出 SourceError。
+    """
+    progress = ImportProgress(len(files))
+    occurrences = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map 按提交顺序返回结果，保证 id 与文件顺序一致
+        results = executor.map(parse_file, [(str(path), dynasty) for _, path, dynasty in files],
+                               chunksize=4)
+
+        for (name, path, _), (rows, error) in zip(files, results):
+            if error:
+                if strict:
+                    raise SourceError(f'处理文件 {path} 时出错: {error}')
+                print(f'\n  警告: 处理文件 {path.name} 时出错: {error}')
+
+            for row in rows:
+                identity = (name, row[1], row[0])
+                occurrence = occurrences.get(identity, 0)
+                occurrences[identity] = occurrence + 1
+                yield row + (poem_key(name, row[1], row[0], occurrence),)
+
+            progress.update(name, len(rows))
+
+    progress.finish()
+
+def poem_key(source, author, title, occurrence):
+    """诗词的稳定标识"""
+    text = '\x1f'.join((source, author, title, str(occurrence)))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def parse_file(args):
+    """解析单个 JSON 文件（在子进程中运行），返回 (行列表, 错误信息)"""
+    file_path, dynasty = args
     try:
-        with open(json_file, 'r', encoding='utf-8') as f:
+        with open(file_path, 'r', encoding='utf-8') as f:
             poems = json.load(f)
-            
-            for poem in poems:
-                if import_poem(cursor, poem, dynasty):
-                    count += 1
     except Exception as e:
-        print(f'  警告: 处理文件 {json_file.name} 时出错: {e}')
-    
-    return count
+        return [], str(e)
 
-def import_poem(cursor, poem_data, dynasty):
-    """导入单首诗词"""
+    rows = []
+    for poem in poems:
+        row = normalize_poem(poem, dynasty)
+        if row is not None:
+            rows.append(row)
+    return rows, None
+
+def normalize_poem(poem_data, dynasty):
+    """将一首诗词规整为待写入的行，内容为空时返回 None"""
     try:
         # 提取数据
-        title = poem_data.get('title', '').strip()
+        title = (poem_data.get('title') or '').strip()
         if not title:
             title = '无题'
         author = poem_data.get('author', '佚名')
-        
+
         # 处理内容（兼容不同格式）
         paragraphs = poem_data.get('paragraphs', [])
         if not paragraphs:
             paragraphs = poem_data.get('content', [])
         if not paragraphs:
             paragraphs = poem_data.get('para', [])  # 纳兰性德格式
-        
+
         if not paragraphs:
-            return False
-        
+            return None
+
         # 合并为纯文本
         content = ''.join(paragraphs)
-        
+
         if not content.strip():
-            return False
-        
+            return None
+
         # 标签
         tags = poem_data.get('tags', [])
-        
-        # 插入数据库
-        cursor.execute('''
-            INSERT INTO poems (title, author, dynasty, content, paragraphs, tags)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
+
+        tags_json = json.dumps(tags, ensure_ascii=False) if tags else None
+        is_untitled = 1 if title == '无题' else 0
+
+        # 内容哈希，增量导入时用于判断诗词是否变化
+        hash_fields = (title, author, dynasty, content,
+                       json.dumps(paragraphs, ensure_ascii=False), tags_json, is_untitled)
+        content_hash = hashlib.sha1('\x1f'.join(str(field) for field in hash_fields).encode('utf-8'))
+
+        return (
             title,
             author,
             dynasty,
             content,
-            json.dumps(paragraphs, ensure_ascii=False),
-            json.dumps(tags, ensure_ascii=False) if tags else None
-        ))
-        
-        return True
-        
+            encode_line_offsets(paragraphs),
+            tags_json,
+            is_untitled,
+            make_excerpt(paragraphs),
+            content_hash.hexdigest()
+        )
+
     except Exception as e:
         print(f'\n  警告: 导入诗词时出错: {e}')
-        return False
+        return None
+
+class ImportProgress:
+    """导入进度与吞吐量报告"""
+
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.files = 0
+        self.poems = 0
+        self.source_counts = {}
+        self.started = time.perf_counter()
+
+    def update(self, source, count):
+        """记录一个文件处理完成"""
+        if self.source_counts and source not in self.source_counts:
+            print()  # 换行
+        self.files += 1
+        self.poems += count
+        self.source_counts[source] = self.source_counts.get(source, 0) + count
+
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        print(f'  [{self.files}/{self.total_files}] {source}: {self.source_counts[source]} 首'
+              f' | 总计 {self.poems} 首, {self.poems / elapsed:.0f} 首/秒', end='\r')
+
+    def finish(self):
+        """输出各数据源的导入数量"""
+        elapsed = time.perf_counter() - self.started
+        print()
+        for source, count in self.source_counts.items():
+            print(f'{source}导入完成: {count} 首')
+        print(f'写入用时 {elapsed:.1f} 秒')
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='古诗词数据导入工具')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='解析文件的进程数（默认为 CPU 核心数）')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量导入：只写入新增、变化和删除的诗词')
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help='全量导入时不询问确认，直接清空现有数据')
+    parser.add_argument('--in-place', action='store_true',
+                        help='直接写入当前数据库，不使用快照（导入期间网站会读到不完整的数据）')
+    args = parser.parse_args()
+
     print('=' * 60)
     print('古诗词数据导入工具')
     print('=' * 60)
-    
-    import_poems()
-    
+
+    try:
+        import_poems(workers=args.workers or os.cpu_count(),
+                     incremental=args.incremental,
+                     assume_yes=args.yes,
+                     in_place=args.in_place)
+    except SourceError as e:
+        print(f'\n❌ {e}')
+        print('已放弃本次增量导入，数据库保持不变')
+        sys.exit(1)
+
     print('\n数据库位置:', Config.DATABASE_PATH)
     print('\n可以运行以下命令启动应用:')
     print('  python app.py')
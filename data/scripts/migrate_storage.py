@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+将旧版本数据库的 paragraphs / pinyin JSON 字段转换为紧凑格式，并压缩数据库文件
+
+导入脚本和拼音生成脚本运行时也会自动转换，这里用于单独升级已有的数据库。
+"""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import Config
+from database import init_db, migrate_storage, bump_dataset_version
+
+def main():
+    print('=' * 60)
+    print('数据库存储格式升级工具')
+    print('=' * 60)
+
+    init_db()
+    size_before = os.path.getsize(Config.DATABASE_PATH)
+
+    conn = sqlite3.connect(Config.DATABASE_PATH)
+    if not migrate_storage(conn):
+        print('数据库已是紧凑格式，无需转换')
+        conn.close()
+        return
+
+    bump_dataset_version(conn)
+    conn.commit()
+
+    print('压缩数据库文件（VACUUM）...')
+    conn.execute('VACUUM')
+    conn.close()
+
+    size_after = os.path.getsize(Config.DATABASE_PATH)
+    print(f'\n✅ 转换完成！数据库大小: {size_before / 1048576:.1f}MB → {size_after / 1048576:.1f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+慢查询报告：按 SQL 语句汇总慢查询日志（见 slow_query.py），列出总耗时最多的语句
+
+每条语句显示次数、总耗时、平均和最大耗时、平均返回行数、涉及的路由，
+以及查询计划中是否有全表扫描（SCAN）或临时 B 树排序（TEMP B-TREE）；
+--plans 同时输出最慢一次的参数和查询计划。
+
+用法：
+    python data/scripts/slow_query_report.py
+    python data/scripts/slow_query_report.py --since 24 --sort max --top 10 --plans
+"""
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import Config
+
+SORT_KEYS = {
+    'total': lambda group: group['total_ms'],
+    'max': lambda group: group['worst']['elapsed_ms'],
+    'count': lambda group: group['count'],
+}
+
+def load_entries(path, since=None):
+    """读取慢查询日志，跳过无法解析的行"""
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if since and entry.get('time', '') < since:
+                continue
+            entries.append(entry)
+    return entries
+
+def group_entries(entries):
+    """按 SQL 语句分组汇总"""
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['sql'])
+        if group is None:
+            group = groups[entry['sql']] = {'sql': entry['sql'], 'count': 0, 'total_ms': 0.0,
+                                             'rows': 0, 'routes': set(), 'worst': entry,
+                                             'full_scan': False, 'temp_btree': False}
+        group['count'] += 1
+        group['total_ms'] += entry['elapsed_ms']
+        group['rows'] += entry.get('rows') or 0
+        group['full_scan'] |= entry.get('full_scan', False)
+        group['temp_btree'] |= entry.get('temp_btree', False)
+        if entry.get('route'):
+            group['routes'].add(entry['route'])
+        if entry['elapsed_ms'] > group['worst']['elapsed_ms']:
+            group['worst'] = entry
+    return list(groups.values())
+
+def print_report(groups, top, plans):
+    for rank, group in enumerate(groups[:top], 1):
+        flags = [name for name, key in (('全表扫描', 'full_scan'), ('临时B树排序', 'temp_btree')) if group[key]]
+        print(f"#{rank}  {group['count']} 次  总计 {group['total_ms']:.1f} ms  "
+              f"平均 {group['total_ms'] / group['count']:.1f} ms  最大 {group['worst']['elapsed_ms']:.1f} ms  "
+              f"平均 {group['rows'] / group['count']:.0f} 行" + (f"  ⚠️ {'、'.join(flags)}" if flags else ''))
+        if group['routes']:
+            print(f"    路由: {', '.join(sorted(group['routes']))}")
+        print(f"    {group['sql']}")
+        if plans:
+            worst = group['worst']
+            print(f"    最慢一次（{worst['time']}）参数: {json.dumps(worst['parameters'], ensure_ascii=False)}")
+            for line in worst.get('plan') or ['（无查询计划）']:
+                print(f'      {line}')
+        print()
+
+def main():
+    parser = argparse.ArgumentParser(description='慢查询报告')
+    parser.add_argument('--log', default=Config.SLOW_QUERY_LOG,
+                        help=f'慢查询日志文件（默认 {Config.SLOW_QUERY_LOG}）')
+    parser.add_argument('--since', type=float, help='只统计最近若干小时')
+    parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='total',
+                        help='排序方式：总耗时 / 最大耗时 / 次数（默认 total）')
+    parser.add_argument('--top', type=int, default=20, help='显示的语句数（默认 20）')
+    parser.add_argument('--plans', action='store_true', help='输出最慢一次的参数和查询计划')
+    args = parser.parse_args()
+
+    since = None
+    if args.since:
+        since = (datetime.now() - timedelta(hours=args.since)).isoformat(timespec='seconds')
+
+    try:
+        entries = load_entries(args.log, since)
+    except FileNotFoundError:
+        print(f'❌ 慢查询日志不存在: {args.log}')
+        sys.exit(1)
+    if not entries:
+        print('没有慢查询记录')
+        return
+
+    groups = sorted(group_entries(entries), key=SORT_KEYS[args.sort], reverse=True)
+    flagged = sum(1 for group in groups if group['full_scan'] or group['temp_btree'])
+    print('=' * 60)
+    print(f'慢查询报告：{len(entries)} 条记录，{len(groups)} 条不同的语句，'
+          f'{flagged} 条有全表扫描或临时 B 树排序')
+    print('=' * 60)
+    print()
+    print_report(groups, args.top, args.plans)
+
+if __name__ == '__main__':
+    main()
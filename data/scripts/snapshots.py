@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+数据库快照管理
+
+导入数据、生成拼音时在 data/snapshots 中创建新快照，完成后把 data/poetry.db（符号链接）
+切换过去；运行中的各 worker 在 DATASET_VERSION_CHECK_INTERVAL 秒内自动改用新快照，无需重启。
+
+用法：
+    python data/scripts/snapshots.py list
+    python data/scripts/snapshots.py rollback              # 回滚到上一个快照
+    python data/scripts/snapshots.py activate poetry-20240101-120000-000000.db
+    python data/scripts/snapshots.py prune --keep 2
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import Config
+from database import (list_snapshots, current_snapshot, activate_snapshot, rollback_snapshot,
+                      prune_snapshots)
+
+def describe(path):
+    """快照的诗词数和数据更新时间"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = dict(conn.execute(
+            "SELECT key, value FROM meta WHERE key IN ('total_poems', 'dataset_updated_at')"
+        ).fetchall())
+    except sqlite3.Error:
+        return '（无法读取）'
+    finally:
+        conn.close()
+    updated_at = int(rows.get('dataset_updated_at', 0))
+    updated = datetime.fromtimestamp(updated_at).isoformat(sep=' ', timespec='seconds') if updated_at else '-'
+    return f"{rows.get('total_poems', 0)} 首  更新于 {updated}"
+
+def list_command(args):
+    snapshots = list_snapshots()
+    current = current_snapshot()
+    if current is None:
+        print(f'{Config.DATABASE_PATH} 不是符号链接，尚未使用快照（下次导入时自动转换）')
+    if not snapshots:
+        print('没有快照')
+        return
+    for path in snapshots:
+        marker = '*' if os.path.realpath(path) == current else ' '
+        size = os.path.getsize(path) / 1024 / 1024
+        print(f'{marker} {os.path.basename(path)}  {size:.1f} MB  {describe(path)}')
+
+def rollback_command(args):
+    path = rollback_snapshot()
+    if path is None:
+        print('❌ 没有可以回滚到的更早快照')
+        sys.exit(1)
+    print(f'✅ 已回滚到 {os.path.basename(path)}')
+
+def activate_command(args):
+    path = os.path.join(Config.SNAPSHOT_DIR, os.path.basename(args.name))
+    if path not in list_snapshots():
+        print(f'❌ 快照不存在: {args.name}')
+        sys.exit(1)
+    activate_snapshot(path)
+    print(f'✅ 已切换到 {os.path.basename(path)}')
+
+def prune_command(args):
+    removed = prune_snapshots(args.keep)
+    for path in removed:
+        print(f'已删除 {os.path.basename(path)}')
+    print(f'✅ 删除了 {len(removed)} 个快照')
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库快照管理')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='列出快照（* 为当前快照）').set_defaults(func=list_command)
+    subparsers.add_parser('rollback', help='回滚到上一个快照').set_defaults(func=rollback_command)
+    activate = subparsers.add_parser('activate', help='切换到指定的快照')
+    activate.add_argument('name', help='快照文件名')
+    activate.set_defaults(func=activate_command)
+    prune = subparsers.add_parser('prune', help='删除旧快照')
+    prune.add_argument('--keep', type=int, default=Config.SNAPSHOT_KEEP,
+                       help=f'保留的快照数，含当前快照（默认 {Config.SNAPSHOT_KEEP}）')
+    prune.set_defaults(func=prune_command)
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,790 @@
+import json
+import os
 import sqlite3
+import threading
+import time
+import unicodedata
 from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from pypinyin.pinyin_dict import pinyin_dict
+import codec
+import metrics
+import slow_query
 from config import Config
 
-@contextmanager
-def get_db():
-    """数据库连接上下文管理器"""
-    conn = sqlite3.connect(Config.DATABASE_PATH)
+# 全文搜索表结构
+# SQLite 默认的 unicode61 分词器会把一整串汉字当成一个词，
+# 因此这里在写入前把文本切分为以空格分隔的单字（见 fts_segment），
+# 查询时再用短语查询匹配相邻的字，任意长度的子串都能走索引。
+# 使用无内容表（content=''）只保存倒排索引，不重复存储正文。
+FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS poems_fts
+    USING fts5(title, author, content, content='', tokenize='unicode61')
+'''
+
+# 拼音全文搜索表：无声调音节和首字母，由 generate_pinyin.py 写入（见 pinyin_fts_insert）
+PINYIN_FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS poems_pinyin_fts
+    USING fts5(syllables, initials, content='', tokenize='unicode61')
+'''
+
+# 朝代展示顺序，未列出的朝代排在最后
+DYNASTY_ORDER = ['先秦', '汉', '魏晋', '南北朝', '隋', '唐', '宋', '元', '明', '清']
+
+# 读连接按线程复用（每个 gunicorn worker 的每个线程各一个），
+# 页缓存和预编译语句在请求之间得以保留
+_local = threading.local()
+# fork 之后子进程不能继续使用父进程打开的连接，也不能关闭它们，只保留引用
+_abandoned_connections = []
+
+def _reset_after_fork():
+    """fork 后丢弃从父进程继承的读连接"""
+    global _local
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        _abandoned_connections.append(conn)
+        metrics.CONNECTIONS.dec('reader')
+    _local = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每条语句耗时的游标
+
+    一条语句的耗时为 execute 和之后各次取结果的耗时之和，在结果取完、执行下一条语句
+    或游标被释放时记录到 metrics；超过 SLOW_QUERY_THRESHOLD_MS 的语句交给 slow_query 记录。
+    """
+
+    _elapsed = None
+    _sql = None
+    _parameters = None
+    _rows = 0
+
+    def _finish(self):
+        if self._elapsed is not None:
+            elapsed, self._elapsed = self._elapsed, None
+            metrics.record_statement(elapsed)
+            if self._sql is not None and elapsed * 1000 >= Config.SLOW_QUERY_THRESHOLD_MS > 0:
+                slow_query.record(self.connection, self._sql, self._parameters, elapsed, self._rows)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._parameters, self._rows = sql, parameters, 0
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_parameters):
+        # 批量写入只记录耗时，不记录慢查询（参数无法重放到 EXPLAIN）
+        self._finish()
+        self._sql = None
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add_elapsed(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add_elapsed(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add_elapsed(started, len(rows), done=True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add_elapsed(started, 0)
+            raise
+        self._add_elapsed(started, 1)
+        return row
+
+    def _add_elapsed(self, started, rows, done=False):
+        """累加取结果的耗时和行数；没有取到行（结果已取完）时记录这条语句"""
+        if self._elapsed is not None:
+            self._elapsed += time.perf_counter() - started
+            self._rows += rows
+            if done or not rows:
+                self._finish()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """默认使用 InstrumentedCursor 的连接
+
+    sqlite3.Connection.execute 在 C 层直接创建普通游标、不调用 cursor()，
+    所以 execute / executemany 也要改为经过 cursor()，否则这些语句不会被计时。
+    """
+
+    readonly = True
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def _connect(readonly):
+    """创建数据库连接并设置 PRAGMA（启用运行指标或慢查询日志时记录每条语句的耗时）"""
+    instrumented = Config.METRICS_ENABLED or Config.SLOW_QUERY_THRESHOLD_MS > 0
+    conn = sqlite3.connect(Config.DATABASE_PATH,
+                           timeout=Config.SQLITE_BUSY_TIMEOUT,
+                           cached_statements=Config.SQLITE_CACHED_STATEMENTS,
+                           factory=InstrumentedConnection if instrumented else sqlite3.Connection)
     conn.row_factory = sqlite3.Row  # 返回字典格式
+    if instrumented:
+        conn.readonly = readonly
+    register_functions(conn)
+
+    conn.execute(f'PRAGMA cache_size = -{int(Config.SQLITE_CACHE_SIZE_KB)}')
+    conn.execute(f'PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
+    return conn
+
+# DATABASE_PATH 当前指向的文件（切换快照后变化），按检查间隔更新
+_database_file = {'id': None, 'checked_at': 0.0}
+
+def _current_database_id():
+    """DATABASE_PATH（符号链接时为其指向的快照）的设备号和 inode"""
+    now = time.monotonic()
+    if (_database_file['id'] is None or
+            now - _database_file['checked_at'] >= Config.DATASET_VERSION_CHECK_INTERVAL):
+        try:
+            stat = os.stat(Config.DATABASE_PATH)
+            file_id = (stat.st_dev, stat.st_ino)
+        except OSError:
+            file_id = None
+        if _database_file['id'] is not None and file_id != _database_file['id']:
+            # 快照已切换，数据版本号立即从新文件重新读取
+            _dataset_version['checked_at'] = float('-inf')
+        _database_file['id'] = file_id
+        _database_file['checked_at'] = now
+    return _database_file['id']
+
+def _get_reader():
+    """获取当前线程的只读连接，不存在或不属于当前进程时重新创建
+
+    DATABASE_PATH 指向的快照切换后，各线程在下一次使用连接时（不在其他 get_db 块中）
+    关闭旧连接并打开新快照，正在执行的查询不受影响，worker 也无需重启。
+    """
+    conn = getattr(_local, 'conn', None)
+    file_id = _current_database_id()
+    if (conn is not None and _local.pid == os.getpid() and _local.file_id != file_id
+            and not getattr(_local, 'depth', 0)):
+        close_connections()
+        conn = None
+        metrics.SNAPSHOT_RECONNECTS.inc()
+
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect(readonly=True)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.file_id = file_id
+        metrics.CONNECTIONS.inc('reader')
+        metrics.CONNECTIONS_OPENED.inc('reader')
+    return conn
+
+def close_connections():
+    """关闭当前线程的读连接（测试或重新导入数据后使用）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+        metrics.CONNECTIONS.dec('reader')
+    _local.conn = None
+
+@contextmanager
+def get_db(write=False):
+    """数据库连接上下文管理器
+
+    默认返回当前线程复用的只读连接（query_only），用完不关闭；
+    write=True 时创建独立的读写连接，退出时关闭。
+    """
+    if write:
+        conn = _connect(readonly=False)
+        metrics.CONNECTIONS.inc('writer')
+        metrics.CONNECTIONS_OPENED.inc('writer')
+        try:
+            yield conn
+        finally:
+            conn.close()
+            metrics.CONNECTIONS.dec('writer')
+        return
+
+    conn = _get_reader()
+    # 嵌套的 get_db 块中不切换快照（外层仍在使用这个连接）
+    _local.depth = getattr(_local, 'depth', 0) + 1
     try:
         yield conn
+    except sqlite3.DatabaseError:
+        # 连接可能已损坏（如数据库文件被替换），最外层的 get_db 块结束后重新创建
+        _local.broken = True
+        raise
     finally:
+        _local.depth -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # 回滚失败不能掩盖块内原本的异常
+            _local.broken = True
+        if _local.depth == 0 and getattr(_local, 'broken', False):
+            _local.broken = False
+            close_connections()
+
+def register_functions(conn):
+    """注册全文索引需要的自定义 SQL 函数"""
+    conn.create_function('fts_segment', 1, fts_segment, deterministic=True)
+    conn.create_function('poem_excerpt', 2, _poem_excerpt, deterministic=True)
+
+def _poem_excerpt(content, lines):
+    """SQL 函数：由 line_offsets（或旧版本的 paragraphs JSON）生成摘要"""
+    if isinstance(lines, bytes):
+        return codec.make_excerpt(codec.decode_paragraphs(content, lines))
+    return codec.make_excerpt(json.loads(lines) if lines else [])
+
+def fts_segment(text):
+    """将文本切分为以空格分隔的单字，供 FTS5 建立逐字索引"""
+    if not text:
+        return ''
+    return ' '.join(ch for ch in text if ch.isalnum())
+
+def fts_query(keyword):
+    """将搜索关键词转换为 FTS5 查询语句
+
+    关键词按空白拆分为多个词，每个词转换为逐字短语查询，多个词之间为 AND 关系。
+    没有可索引字符时返回 None。
+    """
+    phrases = []
+    for term in keyword.split():
+        segmented = fts_segment(term)
+        if segmented:
+            phrases.append(f'"{segmented}"')
+
+    if not phrases:
+        return None
+    return ' '.join(phrases)
+
+def rebuild_fts(conn):
+    """根据 poems 表重建全文搜索索引"""
+    register_functions(conn)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO poems_fts(poems_fts) VALUES('delete-all')")
+    cursor.execute('''
+        INSERT INTO poems_fts(rowid, title, author, content)
+        SELECT id, fts_segment(title), fts_segment(author), fts_segment(content) FROM poems
+    ''')
+
+def fts_insert(cursor, rows):
+    """向全文索引写入诗词，rows 为 (id, title, author, content)"""
+    cursor.executemany(
+        'INSERT INTO poems_fts(rowid, title, author, content) VALUES (?, ?, ?, ?)',
+        [(poem_id, fts_segment(title), fts_segment(author), fts_segment(content))
+         for poem_id, title, author, content in rows]
+    )
+
+def fts_delete(cursor, rows):
+    """从全文索引删除诗词，rows 为写入索引时的原始值 (id, title, author, content)"""
+    cursor.executemany(
+        "INSERT INTO poems_fts(poems_fts, rowid, title, author, content) VALUES ('delete', ?, ?, ?, ?)",
+        [(poem_id, fts_segment(title), fts_segment(author), fts_segment(content))
+         for poem_id, title, author, content in rows]
+    )
+
+def pinyin_toneless(syllable):
+    """去掉拼音的声调（ü 写作 v），非字母字符（标点等）被丢弃"""
+    normalized = unicodedata.normalize('NFD', syllable.lower()).replace('u\u0308', 'v')
+    return ''.join(ch for ch in normalized if 'a' <= ch <= 'z')
+
+def pinyin_search_text(pinyin_lines):
+    """由每句的带声调拼音生成拼音搜索字段：无声调音节以空格连接"""
+    syllables = (pinyin_toneless(syllable) for line in pinyin_lines for syllable in line)
+    return ' '.join(syllable for syllable in syllables if syllable)
+
+def pinyin_initials(text):
+    """拼音搜索字段对应的首字母（以空格分隔，每个字母为一个词）"""
+    return ' '.join(syllable[0] for syllable in text.split())
+
+# 连写拼音最多尝试的切分方式数（如 "fangan" 可切分为 fang an 和 fan gan）
+PINYIN_SEGMENTATION_LIMIT = 4
+
+@lru_cache(maxsize=1)
+def _pinyin_syllables():
+    """全部无声调音节及其前缀，由 pypinyin 的汉字读音表生成"""
+    syllables = {pinyin_toneless(reading)
+                 for readings in pinyin_dict.values() for reading in readings.split(',')}
+    syllables.discard('')
+    prefixes = {syllable[:i] for syllable in syllables for i in range(1, len(syllable) + 1)}
+    return frozenset(syllables), frozenset(prefixes), max(map(len, syllables))
+
+def segment_pinyin(word):
+    """把连写的拼音（如 "mingyue"）切分为音节，最后一个音节可以只输入开头
+
+    返回音节数最少的几种切分（最多 PINYIN_SEGMENTATION_LIMIT 种），无法切分时返回空列表。
+    """
+    syllables, prefixes, max_length = _pinyin_syllables()
+    n = len(word)
+    # fewest[i]：word[i:] 最少切分为几个音节，None 表示无法切分
+    fewest = [None] * n + [0]
+    for i in range(n - 1, -1, -1):
+        for j in range(i + 1, min(n, i + max_length) + 1):
+            piece = word[i:j]
+            if fewest[j] is not None and (piece in syllables or (j == n and piece in prefixes)):
+                if fewest[i] is None or fewest[j] + 1 < fewest[i]:
+                    fewest[i] = fewest[j] + 1
+    if not n or fewest[0] is None:
+        return []
+
+    results = []
+    stack = [(0, [])]
+    while stack and len(results) < PINYIN_SEGMENTATION_LIMIT:
+        i, pieces = stack.pop()
+        if i == n:
+            results.append(pieces)
+            continue
+        # 较长的音节后压栈、先出栈，优先得到音节较长的切分
+        for j in range(i + 1, min(n, i + max_length) + 1):
+            piece = word[i:j]
+            if fewest[j] == fewest[i] - 1 and (piece in syllables or (j == n and piece in prefixes)):
+                stack.append((j, pieces + [piece]))
+    return results
+
+def pinyin_fts_query(keyword):
+    """将拼音关键词转换为拼音全文索引的查询语句
+
+    多个音节（如 "chuang qian ming"）按短语匹配相邻的字，最后一个音节可以只输入开头；
+    连写的音节（如 "mingyue"）先切分为音节再按短语匹配，有歧义时各种切分都匹配；
+    单个词同时按音节前缀和首字母（如 "cqmyg"）匹配。没有字母时返回 None。
+    """
+    words = [word for word in map(pinyin_toneless, keyword.split()) if word]
+    if not words:
+        return None
+
+    # 除最后一个词外，每个词的切分只取第一种，最后一个词保留全部切分
+    head = []
+    for word in words[:-1]:
+        segmentations = segment_pinyin(word)
+        head += segmentations[0] if segmentations else [word]
+    last = segment_pinyin(words[-1]) or [[words[-1]]]
+
+    phrases = [' '.join(head + pieces) for pieces in last]
+    query = ' OR '.join(f'syllables : "{phrase}"*' for phrase in phrases)
+    if len(words) == 1:
+        query += f' OR initials : "{" ".join(words[0])}"'
+    return query
+
+def pinyin_fts_insert(cursor, rows):
+    """向拼音全文索引写入诗词，rows 为 (id, 拼音搜索字段)，空字段跳过"""
+    cursor.executemany(
+        'INSERT INTO poems_pinyin_fts(rowid, syllables, initials) VALUES (?, ?, ?)',
+        [(poem_id, text, pinyin_initials(text)) for poem_id, text in rows if text]
+    )
+
+def pinyin_fts_delete(cursor, rows):
+    """从拼音全文索引删除诗词，rows 为写入索引时的 (id, 拼音搜索字段)"""
+    cursor.executemany(
+        "INSERT INTO poems_pinyin_fts(poems_pinyin_fts, rowid, syllables, initials) "
+        "VALUES ('delete', ?, ?, ?)",
+        [(poem_id, text, pinyin_initials(text)) for poem_id, text in rows if text]
+    )
+
+def _create_aggregate_tables(cursor):
+    """创建预计算的统计表（由导入脚本维护，页面直接读取）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS authors (
+            author TEXT NOT NULL,
+            dynasty TEXT NOT NULL,
+            poem_count INTEGER NOT NULL,
+            PRIMARY KEY (author, dynasty)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_authors_count ON authors(poem_count DESC)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dynasties (
+            dynasty TEXT PRIMARY KEY,
+            poem_count INTEGER NOT NULL,
+            sort_order INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        )
+    ''')
+
+def refresh_aggregates(conn):
+    """根据 poems 表重新计算作者、朝代统计表和总体统计信息"""
+    cursor = conn.cursor()
+    _create_aggregate_tables(cursor)
+
+    cursor.execute('DELETE FROM authors')
+    cursor.execute('''
+        INSERT INTO authors (author, dynasty, poem_count)
+        SELECT author, dynasty, COUNT(*) FROM poems GROUP BY author, dynasty
+    ''')
+
+    cursor.execute('DELETE FROM dynasties')
+    cursor.execute('SELECT dynasty, COUNT(*) FROM poems GROUP BY dynasty')
+    dynasty_rows = cursor.fetchall()
+    cursor.executemany(
+        'INSERT INTO dynasties (dynasty, poem_count, sort_order) VALUES (?, ?, ?)',
+        [(dynasty, poem_count,
+          DYNASTY_ORDER.index(dynasty) + 1 if dynasty in DYNASTY_ORDER else len(DYNASTY_ORDER) + 1)
+         for dynasty, poem_count in dynasty_rows]
+    )
+
+    cursor.execute('SELECT COUNT(*) FROM poems')
+    total_poems = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(DISTINCT author) FROM authors')
+    total_authors = cursor.fetchone()[0]
+
+    cursor.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+        ('total_poems', total_poems),
+        ('total_authors', total_authors),
+        ('total_dynasties', len(dynasty_rows)),
+    ])
+
+def bump_dataset_version(conn):
+    """更新数据版本号（导入数据或生成拼音后调用），各进程的缓存据此失效"""
+    now = time.time()
+    conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+        ('dataset_version', f'{time.time_ns():x}'),
+        ('dataset_updated_at', int(now)),
+    ])
+
+# 数据版本号和更新时间在进程内缓存 DATASET_VERSION_CHECK_INTERVAL 秒
+_dataset_version = {'value': None, 'updated_at': 0, 'checked_at': 0.0}
+
+def _load_dataset_version():
+    """按检查间隔从 meta 表重新读取数据版本号和更新时间"""
+    now = time.monotonic()
+    if (_dataset_version['value'] is None or
+            now - _dataset_version['checked_at'] >= Config.DATASET_VERSION_CHECK_INTERVAL):
+        with get_db() as conn:
+            rows = dict(conn.execute(
+                "SELECT key, value FROM meta WHERE key IN ('dataset_version', 'dataset_updated_at')"
+            ).fetchall())
+        _dataset_version['value'] = rows.get('dataset_version', '0')
+        _dataset_version['updated_at'] = int(rows.get('dataset_updated_at', 0))
+        _dataset_version['checked_at'] = now
+    return _dataset_version
+
+def get_dataset_version():
+    """获取当前数据版本号"""
+    return _load_dataset_version()['value']
+
+def get_dataset_updated_at():
+    """获取数据最后更新的时间（Unix 时间戳，秒）"""
+    return _load_dataset_version()['updated_at']
+
+# 数据库快照
+# 导入数据和生成拼音时在 SNAPSHOT_DIR 中的新文件里完成全部写入，然后把 DATABASE_PATH
+# （指向当前快照的符号链接）原子地替换为指向新文件，运行中的网站始终读到完整的数据；
+# 各 worker 的读连接发现指向的文件变化后自动重新打开（见 _get_reader）。
+# 保留最近 SNAPSHOT_KEEP 个快照，可以回滚到上一个。
+
+def list_snapshots():
+    """按创建时间排序的快照文件路径"""
+    if not os.path.isdir(Config.SNAPSHOT_DIR):
+        return []
+    return sorted(os.path.join(Config.SNAPSHOT_DIR, name) for name in os.listdir(Config.SNAPSHOT_DIR)
+                  if name.startswith('poetry-') and name.endswith('.db'))
+
+def current_snapshot():
+    """DATABASE_PATH 当前指向的快照，不是符号链接（尚未使用快照）时返回 None"""
+    if not os.path.islink(Config.DATABASE_PATH):
+        return None
+    return os.path.realpath(Config.DATABASE_PATH)
+
+def _new_snapshot_path():
+    os.makedirs(Config.SNAPSHOT_DIR, exist_ok=True)
+    name = datetime.now().strftime('poetry-%Y%m%d-%H%M%S-%f.db')
+    return os.path.join(Config.SNAPSHOT_DIR, name)
+
+def _copy_database(source, target):
+    """用 SQLite 的在线备份复制数据库（源数据库可以正在被读写）"""
+    src = sqlite3.connect(source, timeout=Config.SQLITE_BUSY_TIMEOUT)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+def remove_snapshot(path):
+    """删除快照文件及其 -wal / -shm 文件"""
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+def activate_snapshot(path):
+    """把 DATABASE_PATH 原子地切换为指向 path 的符号链接"""
+    live = Config.DATABASE_PATH
+    # 使用相对路径，数据目录整体移动或挂载到容器中后仍然有效
+    target = os.path.relpath(os.path.abspath(path), os.path.dirname(os.path.abspath(live)))
+    tmp_link = f'{live}.{os.getpid()}.tmp'
+    os.symlink(target, tmp_link)
+    os.replace(tmp_link, live)
+
+def _adopt_live_database():
+    """DATABASE_PATH 还是普通文件（尚未使用快照）时，先复制为第一个快照并切换过去，以便回滚"""
+    live = Config.DATABASE_PATH
+    if os.path.exists(live) and not os.path.islink(live):
+        path = _new_snapshot_path()
+        _copy_database(live, path)
+        activate_snapshot(path)
+        # 原文件的 WAL 内容已复制到快照中；仍在使用旧文件的连接持有打开的文件，删除不影响它们
+        for suffix in ('-wal', '-shm'):
+            try:
+                os.remove(live + suffix)
+            except FileNotFoundError:
+                pass
+
+def prune_snapshots(keep=None):
+    """删除最旧的快照，保留最近 keep 个（当前快照不会被删除），返回删除的路径"""
+    keep = Config.SNAPSHOT_KEEP if keep is None else keep
+    current = current_snapshot()
+    snapshots = [path for path in list_snapshots() if os.path.realpath(path) != current]
+    removed = snapshots[:max(0, len(snapshots) - max(keep - 1, 0))] if current else []
+    for path in removed:
+        remove_snapshot(path)
+    return removed
+
+def rollback_snapshot():
+    """切换到当前快照之前的一个快照，返回其路径；没有更早的快照时返回 None"""
+    current = current_snapshot()
+    snapshots = list_snapshots()
+    if current is None:
+        return None
+    previous = [path for path in snapshots if os.path.basename(path) < os.path.basename(current)]
+    if not previous:
+        return None
+    activate_snapshot(previous[-1])
+    return previous[-1]
+
+class SnapshotBuild:
+    """在新的快照文件中写入数据，正常结束时切换为当前快照
+
+        with SnapshotBuild(copy_current=True) as snapshot:
+            ...  # 期间 Config.DATABASE_PATH 指向 snapshot.path
+            snapshot.discard()  # 没有变化时放弃
+
+    copy_current=True 时新快照从当前数据库复制（增量导入、生成拼音），否则为空数据库（全量导入）。
+    出错或调用 discard() 时删除新快照，当前数据库保持不变。
+    """
+
+    def __init__(self, copy_current=True):
+        self.copy_current = copy_current
+        self.path = None
+        self.discarded = False
+        self._live_path = None
+
+    def __enter__(self):
+        _adopt_live_database()
+        self._live_path = Config.DATABASE_PATH
+        self.path = _new_snapshot_path()
+        if self.copy_current and os.path.exists(self._live_path):
+            _copy_database(self._live_path, self.path)
+        Config.DATABASE_PATH = self.path
+        return self
+
+    def discard(self):
+        self.discarded = True
+
+    def __exit__(self, exc_type, exc, tb):
+        Config.DATABASE_PATH = self._live_path
+        if exc_type is not None or self.discarded:
+            remove_snapshot(self.path)
+            return False
+
+        # 合并 WAL，快照作为单个文件切换
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
         conn.close()
+        activate_snapshot(self.path)
+        prune_snapshots()
+        return False
+
+# poems 表的二级索引，批量导入前删除、导入后重建
+# 列表页按 (is_untitled, id) 排序，复合索引使游标分页无需排序
+POEM_INDEXES = {
+    'idx_author_order': 'poems(author, is_untitled, id)',
+    'idx_dynasty_order': 'poems(dynasty, is_untitled, id)',
+    'idx_title': 'poems(title)',
+    'idx_poem_key': 'poems(poem_key)',
+}
+
+def create_indexes(cursor):
+    """创建 poems 表的二级索引"""
+    for name, definition in POEM_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+def drop_indexes(cursor):
+    """删除 poems 表的二级索引（批量导入期间避免逐行维护索引）"""
+    for name in POEM_INDEXES:
+        cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+def _migrate_untitled(cursor):
+    """旧版本数据库没有 is_untitled 字段，补充并回填"""
+    cursor.execute('PRAGMA table_info(poems)')
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'is_untitled' in columns:
+        return
+
+    print('添加 is_untitled 字段...')
+    cursor.execute('ALTER TABLE poems ADD COLUMN is_untitled INTEGER NOT NULL DEFAULT 0')
+    cursor.execute("UPDATE poems SET is_untitled = 1 WHERE title = '无题'")
+
+def _migrate_content_hash(cursor):
+    """旧版本数据库没有 poem_key / content_hash 字段（增量导入使用），补充为空值
+
+    第一次增量导入时，旧数据按标题、作者、朝代（和正文）与数据源中的诗词对应，原地补上
+    poem_key 和 content_hash，诗词 id 保持不变（见 import_data.py 的 match_legacy_rows）。
+    """
+    cursor.execute('PRAGMA table_info(poems)')
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'poem_key' not in columns:
+        cursor.execute('ALTER TABLE poems ADD COLUMN poem_key TEXT')
+    if 'content_hash' not in columns:
+        cursor.execute('ALTER TABLE poems ADD COLUMN content_hash TEXT')
+
+def load_syllable_ids(cursor):
+    """读取拼音音节表，返回 音节 -> id 的映射"""
+    cursor.execute('SELECT syllable, id FROM pinyin_syllables')
+    return dict(cursor.fetchall())
+
+def add_syllables(cursor, syllable_ids, syllables):
+    """将新出现的音节写入音节表，并补充到 syllable_ids 映射中"""
+    new_syllables = sorted(set(syllables) - syllable_ids.keys())
+    next_id = max(syllable_ids.values(), default=0) + 1
+    rows = [(next_id + i, syllable) for i, syllable in enumerate(new_syllables)]
+    cursor.executemany('INSERT INTO pinyin_syllables (id, syllable) VALUES (?, ?)', rows)
+    syllable_ids.update((syllable, syllable_id) for syllable_id, syllable in rows)
+
+def migrate_storage(conn):
+    """将旧版本的 JSON 字段转换为紧凑格式（见 codec.py）
+
+    paragraphs JSON 转为 line_offsets 后删除 paragraphs 字段，pinyin JSON 转为音节 id 数组。
+    数据量大时耗时较长，由导入脚本和 data/scripts/migrate_storage.py 调用，应用启动时不执行。
+    返回是否进行了迁移。
+    """
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA table_info(poems)')
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'paragraphs' not in columns:
+        return False
+
+    print('转换 paragraphs / pinyin 字段为紧凑格式...')
+    if 'line_offsets' not in columns:
+        cursor.execute('ALTER TABLE poems ADD COLUMN line_offsets BLOB')
+    pinyin_column = 'pinyin' if 'pinyin' in columns else 'NULL'
+    syllable_ids = load_syllable_ids(cursor)
+
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT id, paragraphs, {pinyin_column} FROM poems
+            WHERE id > ? ORDER BY id LIMIT 5000
+        ''', (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for poem_id, paragraphs_json, pinyin_json in rows:
+            paragraphs = json.loads(paragraphs_json) if paragraphs_json else []
+            pinyin_blob = pinyin_json or None
+            if pinyin_blob is not None and isinstance(pinyin_json, str):
+                pinyin_lines = json.loads(pinyin_json)
+                add_syllables(cursor, syllable_ids,
+                              [syllable for line in pinyin_lines for syllable in line])
+                pinyin_blob = codec.encode_pinyin(pinyin_lines, syllable_ids)
+            updates.append((codec.encode_line_offsets(paragraphs), pinyin_blob, poem_id))
+
+        if pinyin_column == 'NULL':
+            cursor.executemany('UPDATE poems SET line_offsets = ? WHERE id = ?',
+                               [(offsets, poem_id) for offsets, _, poem_id in updates])
+        else:
+            cursor.executemany('UPDATE poems SET line_offsets = ?, pinyin = ? WHERE id = ?', updates)
+        conn.commit()
+
+    cursor.execute('ALTER TABLE poems DROP COLUMN paragraphs')
+    conn.commit()
+    return True
+
+def _migrate_excerpt(cursor):
+    """旧版本数据库没有 excerpt 字段（列表页摘要），补充并回填"""
+    cursor.execute('PRAGMA table_info(poems)')
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'excerpt' in columns:
+        return
+
+    print('添加 excerpt 字段...')
+    cursor.execute("ALTER TABLE poems ADD COLUMN excerpt TEXT NOT NULL DEFAULT ''")
+    lines_column = 'line_offsets' if 'line_offsets' in columns else 'paragraphs'
+    cursor.execute(f'UPDATE poems SET excerpt = poem_excerpt(content, {lines_column})')
+
+def _migrate_pinyin_text(cursor):
+    """旧版本数据库没有 pinyin_text 字段（拼音搜索），补充为空值，由拼音生成脚本填充"""
+    cursor.execute('PRAGMA table_info(poems)')
+    if 'pinyin_text' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE poems ADD COLUMN pinyin_text TEXT')
+
+def _migrate_fts(cursor):
+    """旧版本使用默认分词的 poems_fts 无法检索中文，检测到时删除并按新结构重建"""
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'poems_fts'")
+    row = cursor.fetchone()
+    if row is None or "content=''" in row[0]:
+        return False
+
+    print('检测到旧版全文索引，正在迁移为逐字索引...')
+    cursor.execute('DROP TABLE poems_fts')
+    return True
 
 def init_db():
     """初始化数据库表结构"""
-    with get_db() as conn:
+    with get_db(write=True) as conn:
         cursor = conn.cursor()
-        
+
+        # WAL 模式下读写互不阻塞（该设置持久保存在数据库文件中）
+        cursor.execute('PRAGMA journal_mode = WAL')
+
+        # 多个 worker 同时启动时串行执行建表和迁移
+        cursor.execute('BEGIN IMMEDIATE')
+
         # 创建诗词表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS poems (
@@ -25,22 +793,64 @@ def init_db():
                 author TEXT NOT NULL,
                 dynasty TEXT NOT NULL,
                 content TEXT NOT NULL,
-                paragraphs TEXT NOT NULL,
+                line_offsets BLOB NOT NULL,
                 tags TEXT,
+                pinyin BLOB,
+                pinyin_text TEXT,
+                is_untitled INTEGER NOT NULL DEFAULT 0,
+                excerpt TEXT NOT NULL DEFAULT '',
+                poem_key TEXT,
+                content_hash TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
+        _migrate_untitled(cursor)
+        _migrate_content_hash(cursor)
+        _migrate_excerpt(cursor)
+        _migrate_pinyin_text(cursor)
+
         # 创建索引
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_author ON poems(author)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_dynasty ON poems(dynasty)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_title ON poems(title)')
-        
-        # 创建全文搜索表
+        create_indexes(cursor)
+        # 旧的单列索引是复合索引的前缀，已经多余
+        cursor.execute('DROP INDEX IF EXISTS idx_author')
+        cursor.execute('DROP INDEX IF EXISTS idx_dynasty')
+
+        # 创建全文搜索表（必要时迁移旧索引）
+        migrated = _migrate_fts(cursor)
+        cursor.execute(FTS_TABLE_SQL)
+        if migrated:
+            rebuild_fts(conn)
+            print('全文索引迁移完成')
+
+        cursor.execute(PINYIN_FTS_TABLE_SQL)
+
+        # 拼音音节表（pinyin 字段保存音节 id）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pinyin_syllables (
+                id INTEGER PRIMARY KEY,
+                syllable TEXT NOT NULL UNIQUE
+            )
+        ''')
+
+        # 相似诗词表（由 build_neighbors.py 离线计算，rank 从 0 开始按相似度排序）
         cursor.execute('''
-            CREATE VIRTUAL TABLE IF NOT EXISTS poems_fts 
-            USING fts5(title, author, content, content='poems', content_rowid='id')
+            CREATE TABLE IF NOT EXISTS poem_neighbors (
+                poem_id INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                neighbor_id INTEGER NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (poem_id, rank)
+            ) WITHOUT ROWID
         ''')
-        
+
+        # 创建统计表；旧数据库首次升级时补算一次
+        _create_aggregate_tables(cursor)
+        cursor.execute("SELECT 1 FROM meta WHERE key = 'total_poems'")
+        if cursor.fetchone() is None:
+            refresh_aggregates(conn)
+        cursor.execute("SELECT 1 FROM meta WHERE key = 'dataset_version'")
+        if cursor.fetchone() is None:
+            bump_dataset_version(conn)
+
         conn.commit()
         print('数据库初始化完成')
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+静态导出：将诗词详情、作者、朝代页面及对应的 JSON 接口渲染为静态文件，由 nginx 直接提供
+
+页面通过 Flask 测试客户端渲染，与线上响应完全一致；进程池中每个进程负责一批诗词或作者、朝代。
+分页页面从第一页和末页出发，沿页面中的分页链接（接口中的游标）遍历，保证所有可达的分页地址都有对应文件。
+
+文件布局（nginx 按 $uri 和 $args 查找，见 docs/deployment.md）：
+
+    /poem/1                    → poem/1/index.html
+    /api/poems/1/similar       → api/poems/1/similar/index.json
+    /author/李白?after=0.123   → author/李白/after=0.123.html
+    /api/stats                 → api/stats/index.json
+
+每个文件同时生成 .gz（以及安装了 brotli 时的 .br）预压缩版本。
+导出状态保存在输出目录的 .export-state.json 中，再次运行时只重新渲染内容或相似诗词变化的诗词、
+作者和朝代（--full 全部重新渲染；修改了模板后需要使用）。首页（随机诗词）和搜索仍由 Flask 提供。
+
+用法：
+    python export.py /var/www/poetry/site
+    python export.py /var/www/poetry/site --full --workers 8
+"""
+
+import argparse
+import gzip
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import unquote, urlsplit
+
+from flask import url_for
+
+from app import app
+from config import Config
+from database import get_db
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 导出状态文件名
+STATE_FILE = '.export-state.json'
+
+# 每个任务渲染的诗词数
+CHUNK_SIZE = 500
+
+# 小于该大小的文件不生成压缩版本（与 nginx gzip_min_length 一致）
+COMPRESS_MIN_SIZE = 1000
+
+HREF_PATTERN = re.compile(r'href="([^"]+)"')
+
+# 导出时逐页渲染全部内容，不是线上请求，不记录慢查询（子进程通过 fork 继承）
+Config.SLOW_QUERY_THRESHOLD_MS = 0
+
+_client = None
+
+def _get_client():
+    """每个进程一个测试客户端"""
+    global _client
+    if _client is None:
+        _client = app.test_client()
+    return _client
+
+def output_path(out_dir, url, extension):
+    """地址对应的文件路径：路径按 nginx 的 $uri 解码，查询参数按 $args 原样作为文件名"""
+    parts = urlsplit(url)
+    directory = os.path.join(out_dir, unquote(parts.path).strip('/'))
+    return os.path.join(directory, (parts.query or 'index') + extension)
+
+def write_file(path, data, compress=True):
+    """写入文件（先写临时文件再改名，nginx 不会读到写了一半的文件）和预压缩版本"""
+    versions = [('', data)]
+    if compress and len(data) >= COMPRESS_MIN_SIZE:
+        versions.append(('.gz', gzip.compress(data, compresslevel=9, mtime=0)))
+        if brotli is not None:
+            versions.append(('.br', brotli.compress(data)))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for suffix, content in versions:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path + suffix)
+
+def render(out_dir, url, compress):
+    """渲染一个地址并写入文件，返回响应（非 200 时不写入）"""
+    response = _get_client().get(url)
+    if response.status_code != 200:
+        return None
+    extension = '.json' if response.mimetype == 'application/json' else '.html'
+    write_file(output_path(out_dir, url, extension), response.get_data(), compress)
+    return response
+
+def crawl_pages(out_dir, path, compress):
+    """从第一页和末页出发，沿页面中同一路径的分页链接渲染全部分页，返回页面数"""
+    pending = [path, f'{path}?before=end']
+    seen = set(pending)
+    while pending:
+        url = pending.pop()
+        response = render(out_dir, url, compress)
+        if response is None:
+            continue
+        for href in HREF_PATTERN.findall(response.get_data(as_text=True)):
+            href = html.unescape(href)
+            if urlsplit(href).path == path and href not in seen:
+                seen.add(href)
+                pending.append(href)
+    return len(seen)
+
+def crawl_api_pages(out_dir, path, compress):
+    """沿接口响应中的 next_cursor / prev_cursor 渲染游标分页接口的全部分页，返回页面数"""
+    pending = [path, f'{path}?before=end']
+    seen = set(pending)
+    while pending:
+        url = pending.pop()
+        response = render(out_dir, url, compress)
+        if response is None:
+            continue
+        result = response.get_json()
+        for name, cursor in (('after', result['next_cursor']), ('before', result['prev_cursor'])):
+            if cursor is not None:
+                href = f'{path}?{name}={cursor}'
+                if href not in seen:
+                    seen.add(href)
+                    pending.append(href)
+    return len(seen)
+
+def export_poems(out_dir, poem_ids, compress):
+    """渲染一批诗词详情页及相似诗词接口（在子进程中运行）"""
+    for poem_id in poem_ids:
+        render(out_dir, f'/poem/{poem_id}', compress)
+        render(out_dir, f'/api/poems/{poem_id}/similar', compress)
+    return len(poem_ids) * 2
+
+def listing_paths(kind, name):
+    """作者或朝代的页面地址和接口地址"""
+    with app.test_request_context():
+        if kind == 'author':
+            return url_for('author_poems', author=name), url_for('api_author_poems', author=name)
+        return url_for('dynasty_poems', dynasty=name), url_for('api_dynasty_poems', dynasty=name)
+
+def export_listing(out_dir, kind, name, compress):
+    """渲染一个作者或朝代的全部分页及对应接口（在子进程中运行）"""
+    path, api_path = listing_paths(kind, name)
+    return crawl_pages(out_dir, path, compress) + crawl_api_pages(out_dir, api_path, compress)
+
+def export_site_pages(out_dir, compress):
+    """渲染作者列表、朝代列表和统计接口"""
+    count = crawl_pages(out_dir, '/authors', compress)
+    for url in ('/dynasties', '/api/stats'):
+        render(out_dir, url, compress)
+        count += 1
+    return count
+
+def load_fingerprints():
+    """计算每首诗词的内容指纹，以及每个作者、朝代的指纹（其下全部诗词指纹的组合）
+
+    详情页和相似诗词接口包含相似诗词（poem_neighbors）的标题、作者和朝代，
+    诗词的指纹同时包含相似诗词及其内容指纹，重新计算相似诗词后对应的页面会重新渲染。
+    """
+    contents = {}
+    authors = {}
+    dynasties = {}
+    with get_db() as conn:
+        cursor = conn.execute('''
+            SELECT id, title, author, dynasty, content, tags, pinyin
+            FROM poems ORDER BY id
+        ''')
+        for poem_id, title, author, dynasty, content, tags, pinyin in cursor:
+            digest = hashlib.sha1(repr((title, author, dynasty, content, tags, pinyin))
+                                  .encode('utf-8')).hexdigest()
+            contents[poem_id] = digest
+            for group, key in ((authors, author), (dynasties, dynasty)):
+                group.setdefault(key, hashlib.sha1()).update(f'{poem_id}:{digest};'.encode('ascii'))
+
+        neighbors = {}
+        for poem_id, neighbor_id, score in conn.execute(
+                'SELECT poem_id, neighbor_id, score FROM poem_neighbors ORDER BY poem_id, rank'):
+            neighbors.setdefault(poem_id, []).append(
+                f'{neighbor_id}:{score}:{contents.get(neighbor_id)};')
+
+    poems = {}
+    for poem_id, digest in contents.items():
+        if poem_id in neighbors:
+            digest = hashlib.sha1((digest + ''.join(neighbors[poem_id])).encode('ascii')).hexdigest()
+        poems[str(poem_id)] = digest
+    return (poems,
+            {key: h.hexdigest() for key, h in authors.items()},
+            {key: h.hexdigest() for key, h in dynasties.items()})
+
+def changed_keys(current, previous):
+    """返回（新增或变化的键，已删除的键）"""
+    changed = [key for key, digest in current.items() if previous.get(key) != digest]
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+def load_state(out_dir):
+    """读取上次导出的状态"""
+    try:
+        with open(os.path.join(out_dir, STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(out_dir, state):
+    """保存导出状态（全部文件写完后才保存，中断后再次运行会重新渲染未完成的部分）"""
+    write_file(os.path.join(out_dir, STATE_FILE),
+               json.dumps(state, ensure_ascii=False).encode('utf-8'), compress=False)
+
+def remove_path(out_dir, url):
+    """删除地址对应的目录（已删除的诗词、作者、朝代）"""
+    shutil.rmtree(os.path.join(out_dir, unquote(url).strip('/')), ignore_errors=True)
+
+def export_site(out_dir, full=False, workers=None, compress=True):
+    """导出站点"""
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+
+    print('计算内容指纹...')
+    poems, authors, dynasties = load_fingerprints()
+    state = {} if full else load_state(out_dir)
+
+    changed_poems, removed_poems = changed_keys(poems, state.get('poems', {}))
+    changed_authors, removed_authors = changed_keys(authors, state.get('authors', {}))
+    changed_dynasties, removed_dynasties = changed_keys(dynasties, state.get('dynasties', {}))
+
+    # 详情页包含同作者的其他作品，作者有变化时重新渲染该作者的全部诗词
+    if changed_authors and not full:
+        dirty = set(changed_authors)
+        with get_db() as conn:
+            author_poem_ids = [str(row[0]) for row in conn.execute(
+                'SELECT id, author FROM poems') if row[1] in dirty]
+        changed_poems = sorted(set(changed_poems) | set(author_poem_ids), key=int)
+
+    print(f'诗词: {len(changed_poems)} 首需要渲染，{len(removed_poems)} 首已删除')
+    print(f'作者: {len(changed_authors)} 位需要渲染，{len(removed_authors)} 位已删除')
+    print(f'朝代: {len(changed_dynasties)} 个需要渲染，{len(removed_dynasties)} 个已删除')
+
+    for poem_id in removed_poems:
+        remove_path(out_dir, f'/poem/{poem_id}')
+        remove_path(out_dir, f'/api/poems/{poem_id}')
+
+    # 分页地址由游标组成，重新渲染前删除旧的分页文件，避免留下失效的游标页面
+    for kind, names in (('author', removed_authors + changed_authors),
+                        ('dynasty', removed_dynasties + changed_dynasties)):
+        for name in names:
+            for path in listing_paths(kind, name):
+                remove_path(out_dir, path)
+
+    rendered = export_site_pages(out_dir, compress)
+    total_tasks = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(export_poems, out_dir, changed_poems[i:i + CHUNK_SIZE], compress)
+                   for i in range(0, len(changed_poems), CHUNK_SIZE)]
+        futures += [executor.submit(export_listing, out_dir, 'author', name, compress)
+                    for name in changed_authors]
+        futures += [executor.submit(export_listing, out_dir, 'dynasty', name, compress)
+                    for name in changed_dynasties]
+        total_tasks = len(futures)
+
+        for done, future in enumerate(as_completed(futures), 1):
+            rendered += future.result()
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            print(f'  进度: {done}/{total_tasks} 个任务，{rendered} 个页面，{rendered / elapsed:.0f} 页/秒',
+                  end='\r')
+
+    save_state(out_dir, {'poems': poems, 'authors': authors, 'dynasties': dynasties})
+
+    print(f'\n\n✅ 导出完成！共渲染 {rendered} 个页面，用时 {time.perf_counter() - started:.1f} 秒')
+    if compress and brotli is None:
+        print('提示: 未安装 brotli，只生成了 .gz 预压缩文件（pip install brotli）')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='将诗词页面和接口导出为静态文件')
+    parser.add_argument('output', help='输出目录（nginx 的 root）')
+    parser.add_argument('--full', action='store_true',
+                        help='全部重新渲染（默认只渲染上次导出后变化的内容；修改模板后使用）')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='渲染进程数（默认为 CPU 核心数）')
+    parser.add_argument('--no-compress', action='store_true',
+                        help='不生成 .gz / .br 预压缩文件')
+    args = parser.parse_args()
+
+    export_site(args.output, full=args.full, workers=args.workers, compress=not args.no_compress)
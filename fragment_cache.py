@@ -0,0 +1,169 @@
+"""
+模板片段缓存
+
+在模板中用 {% cache 键, ... %} ... {% endcache %} 包住渲染代价高的部分（诗词正文和拼音、
+列表页的诗词卡片），渲染结果按（模板名、键、数据版本号）缓存，命中时跳过这部分模板的执行。
+
+- 内存：每个进程一个 LRU 缓存，容量为 FRAGMENT_CACHE_SIZE
+- 磁盘（可选）：FRAGMENT_CACHE_DIR 不为空时，片段同时写入该目录，多个 gunicorn worker 共享；
+  每个数据版本一个子目录。各 worker 发现新版本的时间不同，旧版本的目录在一段时间没有写入后
+  才由正在清理的那一个进程删除；当前版本的片段数超过上限时删除最早写入的
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from cache import LRUCache
+from config import Config
+from database import get_dataset_version
+
+_memory_cache = LRUCache('fragment', Config.FRAGMENT_CACHE_SIZE, Config.CACHE_TTL, get_dataset_version)
+
+class DiskFragmentStore:
+    """按数据版本分目录保存的片段文件，写入时先写临时文件再改名，读写无需加锁"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._version = None
+        self._pruned_at = 0.0
+
+    def _version_dir(self, version):
+        """当前数据版本的目录；版本变化后和每隔 FRAGMENT_CACHE_PRUNE_INTERVAL 秒清理一次"""
+        path = os.path.join(self.directory, version)
+        if version != self._version:
+            os.makedirs(path, exist_ok=True)
+            self._version = version
+            self._pruned_at = float('-inf')
+        if time.monotonic() - self._pruned_at >= Config.FRAGMENT_CACHE_PRUNE_INTERVAL:
+            self._pruned_at = time.monotonic()
+            self.prune(version)
+        return path
+
+    def prune(self, version):
+        """删除过期的其他版本目录，当前版本超出片段数上限时删除最早写入的片段
+
+        同一时刻只有一个进程执行（其他进程拿不到文件锁时直接跳过）。其他版本的目录在
+        FRAGMENT_CACHE_GRACE 秒内有写入时保留：可能是尚未发现版本变化的 worker 正在使用的旧版本，
+        也可能是落后的 worker 眼中的“新版本”。
+        """
+        try:
+            lock = open(os.path.join(self.directory, '.prune.lock'), 'a')
+        except OSError:
+            return
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return
+
+            now = time.time()
+            for entry in os.scandir(self.directory):
+                if entry.name == version or not entry.is_dir(follow_symlinks=False):
+                    continue
+                try:
+                    idle = now - entry.stat().st_mtime
+                except OSError:
+                    continue
+                if idle >= Config.FRAGMENT_CACHE_GRACE:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            self._evict(os.path.join(self.directory, version))
+
+    @staticmethod
+    def _evict(path):
+        """片段数超过 FRAGMENT_CACHE_DISK_MAX_ENTRIES 时，按写入时间删除到上限的 90%"""
+        limit = Config.FRAGMENT_CACHE_DISK_MAX_ENTRIES
+        files = []
+        try:
+            for entry in os.scandir(path):
+                if entry.name.endswith('.html'):
+                    try:
+                        files.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass
+        except OSError:
+            return
+        if len(files) <= limit:
+            return
+        files.sort()
+        for _, file_path in files[:len(files) - limit * 9 // 10]:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _filename(key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.html'
+
+    def get(self, version, key):
+        """读取片段，不存在时返回 None"""
+        path = os.path.join(self.directory, version, self._filename(key))
+        try:
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, version, key, value):
+        """写入片段，写入失败（磁盘已满、目录被删除等）时忽略"""
+        try:
+            directory = self._version_dir(version)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, os.path.join(directory, self._filename(key)))
+        except FileNotFoundError:
+            # 目录已被删除（如手动清理），下次写入时重新创建
+            self._version = None
+        except OSError:
+            pass
+
+_disk_store = DiskFragmentStore(Config.FRAGMENT_CACHE_DIR) if Config.FRAGMENT_CACHE_DIR else None
+
+def get_fragment(key):
+    """读取缓存的片段（先内存后磁盘），不存在时返回 None"""
+    value = _memory_cache.get(key)
+    if value is None and _disk_store is not None:
+        value = _disk_store.get(get_dataset_version(), key)
+        if value is not None:
+            _memory_cache.set(key, value)
+    return value
+
+def set_fragment(key, value):
+    """缓存片段"""
+    _memory_cache.set(key, value)
+    if _disk_store is not None:
+        _disk_store.set(get_dataset_version(), key, value)
+
+class FragmentCacheExtension(Extension):
+    """Jinja 扩展：{% cache 键, ... %} ... {% endcache %}
+
+    键由模板名和标签参数组成；数据版本号由缓存自动区分，不需要写在键里。
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.Tuple(args, 'load')]),
+                               [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        """命中缓存时直接返回，否则渲染片段并缓存"""
+        value = get_fragment(key)
+        if value is None:
+            value = caller()
+            set_fragment(key, str(value))
+        return Markup(value)
@@ -0,0 +1,74 @@
+"""
+HTTP 缓存：基于数据版本号的 ETag / Last-Modified 和条件请求
+
+诗词数据在两次导入之间是只读的，同一 URL 的响应只取决于数据版本号，
+因此 ETag 由数据版本号和请求路径（含查询参数）计算，不需要先生成响应。
+客户端或 CDN 带着匹配的 If-None-Match / If-Modified-Since 重新验证时，
+直接返回 304，不查询数据库也不渲染模板。
+"""
+
+import functools
+import hashlib
+from email.utils import formatdate
+from flask import request, make_response
+from config import Config
+from database import get_dataset_version, get_dataset_updated_at
+
+def cache_control():
+    """可缓存响应的 Cache-Control 头"""
+    value = f'public, max-age={Config.HTTP_CACHE_MAX_AGE}'
+    if Config.HTTP_CACHE_STALE_WHILE_REVALIDATE:
+        value += f', stale-while-revalidate={Config.HTTP_CACHE_STALE_WHILE_REVALIDATE}'
+    return value
+
+def dataset_etag():
+    """当前请求的 ETag（数据版本号 + 请求路径和参数）"""
+    key = '\0'.join((Config.HTTP_CACHE_ETAG_SALT, get_dataset_version(), request.full_path))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _not_modified(etag, updated_at):
+    """判断客户端缓存是否仍然有效（If-None-Match 优先于 If-Modified-Since）"""
+    if request.if_none_match:
+        # If-None-Match 使用弱比较：nginx 的 gzip 会把 ETag 改为 W/"..."
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and updated_at:
+        return request.if_modified_since.timestamp() >= updated_at
+    return False
+
+def _set_headers(response, etag, updated_at):
+    """为响应添加缓存相关的头"""
+    response.set_etag(etag)
+    if updated_at:
+        response.headers['Last-Modified'] = formatdate(updated_at, usegmt=True)
+    response.headers['Cache-Control'] = cache_control()
+    return response
+
+def conditional(view):
+    """只读路由的装饰器：处理条件请求，为成功的响应添加 ETag、Last-Modified 和 Cache-Control
+
+    只有 GET / HEAD 请求的 200 响应会被缓存，404 等错误响应和 POST 请求保持原样。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not Config.HTTP_CACHE_ENABLED or request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+
+        etag = dataset_etag()
+        updated_at = get_dataset_updated_at()
+        if _not_modified(etag, updated_at):
+            return _set_headers(make_response('', 304), etag, updated_at)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            _set_headers(response, etag, updated_at)
+        return response
+    return wrapper
+
+def no_store(view):
+    """每次请求结果都不同的路由（随机诗词）：禁止缓存"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    return wrapper
@@ -0,0 +1,300 @@
+"""
+运行指标
+
+- 路由：每个请求的耗时，以及该请求执行的 SQL 语句数和总耗时（直方图，按路由规则分组）
+- SQL：每条语句从执行到取完结果的耗时（由 database 中的 InstrumentedCursor 记录）
+- 搜索：走全文索引还是退回 LIKE 全表扫描的次数
+- 缓存：各 LRU 缓存的命中、未命中次数和条目数
+- 连接：打开的读、写连接数，切换数据库快照后重新打开的次数
+
+指标保存在进程内，/metrics 以 Prometheus 文本格式输出。多个 gunicorn worker 监听同一端口时，
+设置 METRICS_DIR：每个进程每 METRICS_FLUSH_INTERVAL 秒把自己的指标写入 <pid>.json，
+/metrics 汇总目录中全部进程的文件（计数器和直方图相加，已退出进程的计数保留；
+瞬时值只计入仍在运行的进程），无论哪个 worker 处理抓取请求，结果都是整个服务的指标。
+
+记录一次只是在锁内更新几个计数，每个请求的 SQL 统计保存在线程局部变量中，
+可以在满负载时保持开启（METRICS_ENABLED）。
+SERVER_TIMING_ENABLED 为 True 时，响应带 Server-Timing 头（浏览器开发者工具中可见）。
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+from cache import cache_stats
+from config import Config
+
+# 所有已注册的指标，按注册顺序输出
+_metrics = []
+
+# 路由耗时的直方图分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# 单条 SQL 语句耗时的直方图分桶（秒）
+SQL_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                       0.25, 0.5, 1.0)
+# 每个请求 SQL 语句数的直方图分桶
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """计数器（线程安全），可带标签"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        """(指标名, 标签字符串, 值) 的列表"""
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in values]
+
+class Gauge(Counter):
+    """可增可减的数值"""
+
+    type = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram:
+    """直方图：按分桶统计次数，同时记录总和与总次数"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # [各分桶次数（最后一个为 +Inf）, 总和, 总次数]
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+
+        samples = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                samples.append((f'{self.name}_bucket', labels, cumulative))
+            labels = _format_labels(self.labels, key)
+            samples.append((f'{self.name}_sum', labels, total))
+            samples.append((f'{self.name}_count', labels, count))
+        return samples
+
+REQUEST_DURATION = Histogram('poetry_http_request_duration_seconds', '请求处理耗时（不含流式响应的传输）',
+                             LATENCY_BUCKETS, ('route', 'method', 'status'))
+REQUEST_SQL_STATEMENTS = Histogram('poetry_http_request_sql_statements', '每个请求执行的 SQL 语句数',
+                                   SQL_COUNT_BUCKETS, ('route',))
+REQUEST_SQL_DURATION = Histogram('poetry_http_request_sql_duration_seconds', '每个请求的 SQL 总耗时',
+                                 LATENCY_BUCKETS, ('route',))
+SQL_DURATION = Histogram('poetry_sql_statement_duration_seconds', '单条 SQL 语句从执行到取完结果的耗时',
+                         SQL_LATENCY_BUCKETS)
+SEARCHES = Counter('poetry_search_total', '搜索次数（backend：fts 全文索引 / like 全表扫描 / none 无可检索字符）',
+                   ('mode', 'backend'))
+SEARCH_LIKE_FALLBACKS = Counter('poetry_search_like_fallback_total',
+                                '退回 LIKE 全表扫描的次数（reason：fts_error 索引不可用 / no_results 索引无结果）',
+                                ('reason',))
+CONNECTIONS = Gauge('poetry_sqlite_connections', '当前打开的 SQLite 连接数', ('kind',))
+CONNECTIONS_OPENED = Counter('poetry_sqlite_connections_opened_total', '累计打开的 SQLite 连接数', ('kind',))
+SNAPSHOT_RECONNECTS = Counter('poetry_sqlite_snapshot_reconnects_total', '切换数据库快照后重新打开的读连接数')
+
+# 当前线程正在处理的请求的 SQL 统计
+_request = threading.local()
+
+def start_request(route):
+    """请求开始：记录路由规则，重置当前线程的 SQL 统计"""
+    if Config.METRICS_DIR and _flusher['pid'] != os.getpid():
+        _start_flusher()
+    _request.route = route
+    _request.started = time.perf_counter()
+    _request.sql_count = 0
+    _request.sql_time = 0.0
+    _request.active = True
+
+def record_statement(elapsed):
+    """记录一条 SQL 语句的耗时（秒）"""
+    SQL_DURATION.observe(elapsed)
+    if getattr(_request, 'active', False):
+        _request.sql_count += 1
+        _request.sql_time += elapsed
+
+def current_route():
+    """当前线程正在处理的请求的路由规则，不在请求中时返回 None"""
+    return _request.route if getattr(_request, 'active', False) else None
+
+def finish_request(response, method):
+    """请求结束：记录耗时和 SQL 统计，按配置添加 Server-Timing 头"""
+    if not getattr(_request, 'active', False):
+        return response
+    _request.active = False
+    route = _request.route
+    elapsed = time.perf_counter() - _request.started
+
+    REQUEST_DURATION.observe(elapsed, route, method, str(response.status_code))
+    REQUEST_SQL_STATEMENTS.observe(_request.sql_count, route)
+    REQUEST_SQL_DURATION.observe(_request.sql_time, route)
+
+    if Config.SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = (
+            f'db;dur={_request.sql_time * 1000:.2f};desc="{_request.sql_count} queries", '
+            f'app;dur={elapsed * 1000:.2f}'
+        )
+    return response
+
+def _cache_families():
+    """缓存命中次数等在输出时从 cache_stats() 读取，不在请求中额外计数"""
+    families = [
+        ('poetry_cache_hits_total', 'counter', '缓存命中次数', 'hits'),
+        ('poetry_cache_misses_total', 'counter', '缓存未命中次数', 'misses'),
+        ('poetry_cache_entries', 'gauge', '缓存条目数', 'size'),
+    ]
+    stats = cache_stats()
+    return [(name, metric_type, documentation,
+             [(name, _format_labels(('cache',), (cache_name,)), cache[key])
+              for cache_name, cache in stats.items()])
+            for name, metric_type, documentation, key in families]
+
+def _families():
+    """本进程的全部指标：(名称, 类型, 说明, [(样本名, 标签字符串, 值)]) 的列表"""
+    families = [(metric.name, metric.type, metric.documentation, metric.samples())
+                for metric in _metrics]
+    return families + _cache_families()
+
+def _hit_ratio_family(families):
+    """由命中、未命中次数计算各缓存的命中率（多进程汇总后同样适用）"""
+    counts = {name: {labels: value for _, labels, value in samples}
+              for name, _, _, samples in families
+              if name in ('poetry_cache_hits_total', 'poetry_cache_misses_total')}
+    hits = counts.get('poetry_cache_hits_total', {})
+    misses = counts.get('poetry_cache_misses_total', {})
+    samples = []
+    for labels, hit_count in hits.items():
+        total = hit_count + misses.get(labels, 0)
+        samples.append(('poetry_cache_hit_ratio', labels, round(hit_count / total, 4) if total else 0.0))
+    return ('poetry_cache_hit_ratio', 'gauge', '缓存命中率', samples)
+
+# 多进程汇总：每个进程的指标文件
+_flusher = {'pid': None, 'last': None}
+_flusher_lock = threading.Lock()
+
+def _snapshot_path(pid):
+    return os.path.join(Config.METRICS_DIR, f'{pid}.json')
+
+def write_snapshot():
+    """把本进程的指标写入 METRICS_DIR/<pid>.json（先写临时文件再改名），没有变化时不写"""
+    data = json.dumps(_families(), ensure_ascii=False)
+    if data == _flusher['last']:
+        return
+    path = _snapshot_path(os.getpid())
+    try:
+        os.makedirs(Config.METRICS_DIR, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        return
+    _flusher['last'] = data
+
+def _flush_loop(pid):
+    while _flusher['pid'] == pid:
+        time.sleep(Config.METRICS_FLUSH_INTERVAL)
+        write_snapshot()
+
+def _start_flusher():
+    """每个进程（包括 fork 出的 worker）第一次处理请求时启动写入线程"""
+    with _flusher_lock:
+        pid = os.getpid()
+        if _flusher['pid'] == pid:
+            return
+        _flusher['pid'] = pid
+        _flusher['last'] = None
+        threading.Thread(target=_flush_loop, args=(pid,), name='metrics-flush', daemon=True).start()
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _aggregate():
+    """汇总 METRICS_DIR 中全部进程的指标：同名同标签的样本相加，已退出进程的瞬时值不计入"""
+    families = {}
+    for path in sorted(glob.glob(os.path.join(Config.METRICS_DIR, '*.json'))):
+        try:
+            pid = int(os.path.basename(path)[:-len('.json')])
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (ValueError, OSError):
+            continue
+        alive = _is_alive(pid)
+        for name, metric_type, documentation, samples in data:
+            family = families.setdefault(name, (metric_type, documentation, {}))
+            if metric_type == 'gauge' and not alive:
+                continue
+            values = family[2]
+            for sample_name, labels, value in samples:
+                values[(sample_name, labels)] = values.get((sample_name, labels), 0) + value
+    return [(name, metric_type, documentation,
+             [(sample_name, labels, value) for (sample_name, labels), value in values.items()])
+            for name, (metric_type, documentation, values) in families.items()]
+
+def render():
+    """Prometheus 文本格式（0.0.4）的全部指标；设置了 METRICS_DIR 时为全部进程的汇总"""
+    if Config.METRICS_DIR:
+        write_snapshot()
+        families = _aggregate()
+    else:
+        families = _families()
+    families.append(_hit_ratio_family(families))
+
+    lines = []
+    for name, metric_type, documentation, samples in families:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{labels} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
@@ -1,47 +1,381 @@
+import bisect
+import heapq
 import json
-from database import get_db
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pypinyin import lazy_pinyin, Style
+from cache import LRUCache, cached
+from codec import LazyPinyin, decode_paragraphs, decode_first_line_ids
+import metrics
+from database import get_db, fts_query, pinyin_fts_query, get_dataset_version
 from config import Config
 
+class _RandomIdSampler:
+    """随机 id 抽样器
+
+    缓存全部诗词 id（紧凑的整数数组，30 万首约 2.4MB），抽样时只在数组中取下标，
+    删除留下的 id 空洞不会影响均匀性。缓存超过 RANDOM_ID_CACHE_TTL 秒
+    或数据版本变化后重新加载。
+    """
+
+    def __init__(self):
+        self._ids = array('q')
+        self._loaded_at = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def sample(self, cursor, count, reload=False):
+        """抽取 count 个不重复的 id"""
+        version = get_dataset_version()
+        with self._lock:
+            expired = (self._loaded_at is None or self._version != version or
+                       time.monotonic() - self._loaded_at > Config.RANDOM_ID_CACHE_TTL)
+            if reload or expired:
+                cursor.execute('SELECT id FROM poems ORDER BY id')
+                self._ids = array('q', (row[0] for row in cursor))
+                self._loaded_at = time.monotonic()
+                self._version = version
+            ids = self._ids
+
+        count = max(0, min(count, len(ids)))
+        return [ids[i] for i in random.sample(range(len(ids)), count)]
+
+_random_sampler = _RandomIdSampler()
+
+# 指向最后一页的特殊游标
+CURSOR_END = 'end'
+
+# 拼音音节表（按 id 索引），数据版本变化时重新加载
+_syllables = {'version': None, 'list': []}
+
+def _get_syllables():
+    """获取按 id 索引的拼音音节列表"""
+    version = get_dataset_version()
+    if _syllables['version'] != version:
+        with get_db() as conn:
+            rows = conn.execute('SELECT id, syllable FROM pinyin_syllables').fetchall()
+        syllables = [None] * (max((row['id'] for row in rows), default=0) + 1)
+        for row in rows:
+            syllables[row['id']] = row['syllable']
+        _syllables['list'] = syllables
+        _syllables['version'] = version
+    return _syllables['list']
+
+def _initial(syllable):
+    """拼音的首字母（去掉声调），标点等非字母返回空字符串"""
+    letter = unicodedata.normalize('NFD', syllable[:1])[:1].lower()
+    return letter if 'a' <= letter <= 'z' else ''
+
+class _SuggestIndex:
+    """输入提示的前缀索引
+
+    作者、标题、首句三类条目各自一个按键排序的数组，查询时用 bisect 定位前缀范围，
+    在范围内按权重（作品数、同名诗词数）取前几项。范围超过 SUGGEST_SCAN_LIMIT 项的前缀
+    （"李"、"l" 这类常见的短前缀）在构建时预先算好权重最高的 SUGGEST_LIMIT 项，查询时直接使用。
+    作者和首句还以拼音首字母作为键（如 "lb" → 李白）：作者的首字母由 pypinyin 生成，
+    首句的首字母取自已生成的拼音字段。
+    索引在第一次查询时构建，数据版本变化后重新构建。
+    """
+
+    KINDS = ('author', 'title', 'line')
+
+    def __init__(self):
+        self._indexes = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _get_indexes(self):
+        version = get_dataset_version()
+        if self._version != version:
+            with self._lock:
+                if self._version != version:
+                    self._indexes = self._build()
+                    self._version = version
+        return self._indexes
+
+    @staticmethod
+    def _sorted_index(items):
+        """items 为 (键, 文本, 诗词 id, 权重)，返回按键排序的 (键列表, 条目列表, 常见前缀的结果表)"""
+        items.sort(key=lambda item: item[0])
+        keys = [item[0] for item in items]
+        entries = [item[1:] for item in items]
+        return keys, entries, _SuggestIndex._top_table(keys, entries)
+
+    @staticmethod
+    def _top_table(keys, entries):
+        """范围超过 SUGGEST_SCAN_LIMIT 项的前缀 -> 范围内权重最高的 SUGGEST_LIMIT 项的下标
+
+        从一个字符的前缀开始，只在范围仍然过大的前缀下继续加长，每个条目只会被处理有限几次。
+        """
+        top = {}
+        pending = [(0, len(keys), 0)]   # (范围开始, 范围结束, 范围内键的公共前缀长度)
+        while pending:
+            start, end, length = pending.pop()
+            i = start
+            while i < end:
+                if len(keys[i]) <= length:
+                    i += 1
+                    continue
+                prefix = keys[i][:length + 1]
+                j = bisect.bisect_left(keys, prefix + '\U0010ffff', i, end)
+                if j - i > Config.SUGGEST_SCAN_LIMIT:
+                    top[prefix] = heapq.nlargest(Config.SUGGEST_LIMIT, range(i, j),
+                                                 key=lambda k: entries[k][2])
+                    pending.append((i, j, length + 1))
+                i = j
+        return top
+
+    def _build(self):
+        authors = []
+        titles = {}
+        lines = {}
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT author, SUM(poem_count) FROM authors GROUP BY author')
+            for author, poem_count in cursor.fetchall():
+                authors.append((author, author, None, poem_count))
+                initials = ''.join(lazy_pinyin(author, style=Style.FIRST_LETTER)).lower()
+                if initials.isascii() and initials.isalpha() and initials != author:
+                    authors.append((initials, author, None, poem_count))
+
+            syllables = _get_syllables()
+            syllable_initials = [_initial(syllable) if syllable else '' for syllable in syllables]
+
+            cursor.execute('SELECT id, title, is_untitled, excerpt, pinyin FROM poems ORDER BY id')
+            while True:
+                rows = cursor.fetchmany(Config.EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                for poem_id, title, is_untitled, excerpt, pinyin in rows:
+                    if not is_untitled and title:
+                        entry = titles.get(title)
+                        titles[title] = [entry[0], entry[1] + 1] if entry else [poem_id, 1]
+                    if not Config.SUGGEST_FIRST_LINES:
+                        continue
+                    first_line = excerpt.split('\n', 1)[0]
+                    if not first_line or first_line in lines:
+                        continue
+                    initials = ''
+                    if isinstance(pinyin, bytes):
+                        initials = ''.join(syllable_initials[i] for i in decode_first_line_ids(pinyin)
+                                           if i < len(syllable_initials))
+                    lines[first_line] = (poem_id, initials)
+
+        title_items = [(title, title, poem_id, count) for title, (poem_id, count) in titles.items()]
+        line_items = [(line, line, poem_id, 1) for line, (poem_id, _) in lines.items()]
+        line_items += [(initials, line, poem_id, 1) for line, (poem_id, initials) in lines.items()
+                       if initials]
+        return {
+            'author': self._sorted_index(authors),
+            'title': self._sorted_index(title_items),
+            'line': self._sorted_index(line_items),
+        }
+
+    def suggest(self, prefix, limit):
+        """返回以 prefix 开头的提示，作者、标题、首句依次排列"""
+        indexes = self._get_indexes()
+        results = []
+        seen = set()
+        for kind in self.KINDS:
+            keys, entries, top = indexes[kind]
+            candidates = top.get(prefix)
+            if candidates is None:
+                # 不在结果表中的前缀，范围不超过 SUGGEST_SCAN_LIMIT 项
+                start = bisect.bisect_left(keys, prefix)
+                end = bisect.bisect_left(keys, prefix + '\U0010ffff', start)
+                candidates = heapq.nlargest(limit, range(start, end), key=lambda i: entries[i][2])
+            for i in candidates[:limit]:
+                text, poem_id, _ = entries[i]
+                if (kind, text) not in seen:
+                    seen.add((kind, text))
+                    results.append({'type': kind, 'text': text, 'id': poem_id})
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+_suggest_index = _SuggestIndex()
+
+# 列表、搜索结果只需要的字段（不读取正文和拼音）
+SUMMARY_COLUMNS = 'id, title, author, dynasty, is_untitled, excerpt'
+# 随机诗词展示全文，但不需要拼音
+TEXT_COLUMNS = 'id, title, author, dynasty, is_untitled, excerpt, content, line_offsets, tags'
+# 尚未转换为紧凑格式的旧版本数据库
+LEGACY_TEXT_COLUMNS = 'id, title, author, dynasty, is_untitled, excerpt, content, paragraphs, tags'
+
+# 批量接口可以选择的字段及需要读取的列（paragraphs 由 content 和 line_offsets 还原）
+POEM_FIELDS = {
+    'id': ('id',),
+    'title': ('title',),
+    'author': ('author',),
+    'dynasty': ('dynasty',),
+    'is_untitled': ('is_untitled',),
+    'excerpt': ('excerpt',),
+    'content': ('content',),
+    'paragraphs': ('content', 'line_offsets'),
+    'tags': ('tags',),
+    'pinyin': ('pinyin',),
+}
+
+_storage_format = {'version': None, 'legacy': False}
+
+def _is_legacy_storage(cursor):
+    """数据库是否尚未转换为紧凑格式（仍以 JSON 保存 paragraphs）"""
+    version = get_dataset_version()
+    if _storage_format['version'] != version:
+        cursor.execute('PRAGMA table_info(poems)')
+        columns = [column[1] for column in cursor.fetchall()]
+        _storage_format['legacy'] = 'paragraphs' in columns
+        _storage_format['version'] = version
+    return _storage_format['legacy']
+
+def _field_columns(cursor, fields):
+    """读取 POEM_FIELDS 中一组字段需要的列"""
+    columns = {'id'}
+    for field in fields:
+        columns.update(POEM_FIELDS[field])
+    if 'line_offsets' in columns and _is_legacy_storage(cursor):
+        columns.discard('line_offsets')
+        columns.add('paragraphs')
+    return ', '.join(sorted(columns))
+
+def _get_text_columns(cursor):
+    """根据数据库是否已转换为紧凑格式，返回读取全文需要的字段"""
+    return LEGACY_TEXT_COLUMNS if _is_legacy_storage(cursor) else TEXT_COLUMNS
+
+# 热点查询缓存，数据版本变化时自动失效
+_poem_cache = LRUCache('poem', Config.POEM_CACHE_SIZE, Config.CACHE_TTL, get_dataset_version)
+_list_cache = LRUCache('list', Config.LIST_CACHE_SIZE, Config.CACHE_TTL, get_dataset_version)
+
 class PoemModel:
-    """诗词数据模型"""
+    """诗词数据模型
+
+    只有 get_by_id 返回完整字段；列表和搜索结果只包含 SUMMARY_COLUMNS 中的摘要字段。
+    get_by_id、get_by_author、get_by_dynasty 的结果会被缓存并在请求间共享，调用方不应修改。
+    """
     
     @staticmethod
-    def search(keyword, limit=None):
-        """全文搜索诗词"""
-        if limit is None:
-            limit = Config.SEARCH_RESULTS_LIMIT
-            
+    def search(keyword, page=1, page_size=None, mode='text'):
+        """全文搜索诗词（按相关度排序并分页）
+
+        使用 bm25 打分，标题、作者的权重高于正文（见 SEARCH_BM25_WEIGHTS）。
+        每次只取一页数据；总数最多统计到 SEARCH_COUNT_LIMIT 条，
+        超出时 total_is_estimate 为 True。
+
+        mode='pinyin' 时按正文拼音搜索（无声调音节如 "chuang qian"，或首字母如 "cqmyg"），
+        使用拼音全文索引（由 generate_pinyin.py 生成）。
+
+        仅当索引不可用（如尚未建立），或配置了 SEARCH_LIKE_FALLBACK 且索引无结果时，
+        才退回 LIKE 全表扫描（拼音搜索没有后备方案）。
+        """
+        if page_size is None:
+            page_size = Config.POEMS_PER_PAGE
+        page_size = max(1, min(page_size, Config.SEARCH_RESULTS_LIMIT))
+        page = max(1, page)
+
+        pinyin = mode == 'pinyin'
+        query = pinyin_fts_query(keyword) if pinyin else fts_query(keyword)
+        if query is None:
+            metrics.SEARCHES.inc(mode, 'none')
+            return PoemModel._search_result([], 0, False, page, page_size)
+
+        offset = (page - 1) * page_size
+        if pinyin:
+            table, weights = 'poems_pinyin_fts', ()
+        else:
+            table, weights = 'poems_fts', Config.SEARCH_BM25_WEIGHTS
+        score = f"bm25({table}{''.join(', ?' for _ in weights)})"
+
         with get_db() as conn:
             cursor = conn.cursor()
-            
-            # 尝试 FTS5 全文搜索
+
             try:
-                cursor.execute('''
-                    SELECT p.* FROM poems p
-                    JOIN poems_fts ON poems_fts.rowid = p.id
-                    WHERE poems_fts MATCH ?
-                    LIMIT ?
-                ''', (keyword, limit))
+                # 命中数估计（只统计到上限）
+                cursor.execute(f'''
+                    SELECT COUNT(*) AS total FROM (
+                        SELECT rowid FROM {table} WHERE {table} MATCH ? LIMIT ?
+                    )
+                ''', (query, Config.SEARCH_COUNT_LIMIT + 1))
+                total = cursor.fetchone()['total']
+
+                # 先在索引内排序分页，再回表取当前页数据
+                cursor.execute(f'''
+                    SELECT {SUMMARY_COLUMNS} FROM (
+                        SELECT rowid, {score} AS score
+                        FROM {table}
+                        WHERE {table} MATCH ?
+                        ORDER BY score, rowid
+                        LIMIT ? OFFSET ?
+                    ) AS r
+                    JOIN poems ON poems.id = r.rowid
+                    ORDER BY r.score, r.rowid
+                ''', (*weights, query, page_size, offset))
                 rows = cursor.fetchall()
-                
-                # 如果 FTS5 搜索有结果，直接返回
-                if rows:
-                    return [PoemModel._row_to_dict(row) for row in rows]
-            except:
-                pass
-            
-            # 如果 FTS5 搜索失败或无结果，使用 LIKE 模糊搜索
-            search_pattern = f'%{keyword}%'
-            cursor.execute('''
-                SELECT * FROM poems 
+            except sqlite3.OperationalError:
+                # 全文索引不存在或损坏
+                if pinyin:
+                    metrics.SEARCHES.inc(mode, 'none')
+                    return PoemModel._search_result([], 0, False, page, page_size)
+                metrics.SEARCH_LIKE_FALLBACKS.inc('fts_error')
+                return PoemModel._search_like(cursor, keyword, page, page_size)
+
+            if not total and Config.SEARCH_LIKE_FALLBACK and not pinyin:
+                metrics.SEARCH_LIKE_FALLBACKS.inc('no_results')
+                return PoemModel._search_like(cursor, keyword, page, page_size)
+
+            metrics.SEARCHES.inc(mode, 'fts')
+
+            poems = [PoemModel._row_to_dict(row) for row in rows]
+            estimated = total > Config.SEARCH_COUNT_LIMIT
+            return PoemModel._search_result(poems, min(total, Config.SEARCH_COUNT_LIMIT),
+                                            estimated, page, page_size)
+
+    @staticmethod
+    def _search_like(cursor, keyword, page, page_size):
+        """LIKE 模糊搜索（全表扫描，仅作为显式的后备方案）"""
+        metrics.SEARCHES.inc('text', 'like')
+        search_pattern = f'%{keyword}%'
+        offset = (page - 1) * page_size
+
+        cursor.execute('''
+            SELECT COUNT(*) AS total FROM (
+                SELECT id FROM poems
                 WHERE title LIKE ? OR author LIKE ? OR content LIKE ?
                 LIMIT ?
-            ''', (search_pattern, search_pattern, search_pattern, limit))
-            
-            rows = cursor.fetchall()
-            return [PoemModel._row_to_dict(row) for row in rows]
-    
+            )
+        ''', (search_pattern, search_pattern, search_pattern, Config.SEARCH_COUNT_LIMIT + 1))
+        total = cursor.fetchone()['total']
+
+        cursor.execute(f'''
+            SELECT {SUMMARY_COLUMNS} FROM poems
+            WHERE title LIKE ? OR author LIKE ? OR content LIKE ?
+            ORDER BY id
+            LIMIT ? OFFSET ?
+        ''', (search_pattern, search_pattern, search_pattern, page_size, offset))
+
+        rows = cursor.fetchall()
+        poems = [PoemModel._row_to_dict(row) for row in rows]
+        estimated = total > Config.SEARCH_COUNT_LIMIT
+        return PoemModel._search_result(poems, min(total, Config.SEARCH_COUNT_LIMIT),
+                                        estimated, page, page_size)
+
     @staticmethod
+    def _search_result(poems, total, estimated, page, page_size):
+        """组装搜索结果分页信息"""
+        return {
+            'poems': poems,
+            'total': total,
+            'total_is_estimate': estimated,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total + page_size - 1) // page_size
+        }
+
+    @staticmethod
+    @cached(_poem_cache)
     def get_by_id(poem_id):
         """根据 ID 获取诗词"""
         with get_db() as conn:
@@ -54,94 +388,241 @@ class PoemModel:
             return None
     
     @staticmethod
-    def get_by_author(author, page=1, page_size=None):
-        """根据作者获取诗词列表"""
-        if page_size is None:
-            page_size = Config.POEMS_PER_PAGE
-            
-        offset = (page - 1) * page_size
-        
+    @cached(_list_cache)
+    def get_similar(poem_id, limit=None):
+        """相似诗词（摘要字段，按相似度从高到低），没有预先计算时返回空列表
+
+        相似诗词由 build_neighbors.py 离线计算后保存在 poem_neighbors 表中，
+        这里只需一次按主键的查找。
+        """
+        if limit is None:
+            limit = Config.SIMILAR_POEMS_LIMIT
+
         with get_db() as conn:
             cursor = conn.cursor()
-            
-            # 获取总数
-            cursor.execute('SELECT COUNT(*) as total FROM poems WHERE author = ?', (author,))
-            total = cursor.fetchone()['total']
-            
-            # 获取分页数据（有标题的诗歌优先）
-            cursor.execute('''
-                SELECT * FROM poems 
-                WHERE author = ?
-                ORDER BY 
-                    CASE WHEN title = '无题' THEN 1 ELSE 0 END,
-                    id
-                LIMIT ? OFFSET ?
-            ''', (author, page_size, offset))
-            
-            rows = cursor.fetchall()
-            poems = [PoemModel._row_to_dict(row) for row in rows]
-            
-            return {
-                'poems': poems,
-                'total': total,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size
-            }
+            cursor.execute(f'''
+                SELECT {SUMMARY_COLUMNS}, score
+                FROM poem_neighbors
+                JOIN poems ON poems.id = poem_neighbors.neighbor_id
+                WHERE poem_neighbors.poem_id = ?
+                ORDER BY rank
+                LIMIT ?
+            ''', (poem_id, limit))
+            return [PoemModel._row_to_dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def get_many(poem_ids, fields=None):
+        """根据一组 ID 批量获取诗词（一次 IN 查询），返回 {id: 诗词}，按 poem_ids 的顺序排列，不存在的 ID 不包含在内
+
+        fields 为 POEM_FIELDS 中的字段名列表，只读取这些字段需要的列；None 表示全部字段。
+        """
+        if fields is None:
+            fields = list(POEM_FIELDS)
+        poem_ids = list(dict.fromkeys(poem_ids))
+        if not poem_ids:
+            return {}
+
+        with get_db() as conn:
+            cursor = conn.cursor()
+
+            columns = _field_columns(cursor, fields)
+            placeholders = ', '.join('?' * len(poem_ids))
+            cursor.execute(f'SELECT {columns} FROM poems WHERE id IN ({placeholders})', poem_ids)
+            poems = {row['id']: PoemModel._row_to_dict(row) for row in cursor.fetchall()}
+
+        return {poem_id: {field: poems[poem_id].get(field) for field in fields}
+                for poem_id in poem_ids if poem_id in poems}
+
+    @staticmethod
+    def iter_poems(dynasty=None, author=None, fields=None):
+        """按 ID 顺序逐首产出诗词（可按朝代、作者筛选），用于批量导出
+
+        结果集通过同一个游标按 EXPORT_CHUNK_SIZE 分块读取，不会一次性载入内存。
+        fields 的含义同 get_many。
+        """
+        if fields is None:
+            fields = list(POEM_FIELDS)
+
+        conditions = []
+        params = []
+        if dynasty:
+            conditions.append('dynasty = ?')
+            params.append(dynasty)
+        if author:
+            conditions.append('author = ?')
+            params.append(author)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with get_db() as conn:
+            cursor = conn.cursor()
+            columns = _field_columns(cursor, fields)
+            try:
+                cursor.execute(f'SELECT {columns} FROM poems {where} ORDER BY id', params)
+                while True:
+                    rows = cursor.fetchmany(Config.EXPORT_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        poem = PoemModel._row_to_dict(row)
+                        yield {field: poem.get(field) for field in fields}
+            finally:
+                cursor.close()
+
+    @staticmethod
+    @cached(_list_cache)
+    def get_by_author(author, after=None, before=None, page_size=None):
+        """根据作者获取诗词列表（游标分页，见 _get_page）"""
+        return PoemModel._get_page('author', author, after, before, page_size)
+    
+    @staticmethod
+    @cached(_list_cache)
+    def get_by_dynasty(dynasty, after=None, before=None, page_size=None):
+        """根据朝代获取诗词列表（游标分页，见 _get_page）"""
+        return PoemModel._get_page('dynasty', dynasty, after, before, page_size)
     
     @staticmethod
-    def get_by_dynasty(dynasty, page=1, page_size=None):
-        """根据朝代获取诗词列表"""
+    def encode_cursor(poem):
+        """根据诗词生成分页游标"""
+        return f"{poem['is_untitled']}.{poem['id']}"
+    
+    @staticmethod
+    def _decode_cursor(cursor_value):
+        """解析分页游标，格式为 "is_untitled.id"，无效时返回 None"""
+        if cursor_value == CURSOR_END:
+            return (2, 0)  # 排在所有诗词之后
+        try:
+            is_untitled, poem_id = cursor_value.split('.')
+            return (int(is_untitled), int(poem_id))
+        except (AttributeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _get_page(column, value, after, before, page_size):
+        """按 (is_untitled, id) 游标分页查询某作者或朝代的诗词
+
+        有标题的诗歌优先，其次按 id 排序。after 为下一页游标，before 为上一页游标
+        （before=CURSOR_END 表示最后一页）。查询沿 (column, is_untitled, id) 复合索引定位，
+        任何一页（包括最后一页）的代价都相同。
+        """
         if page_size is None:
             page_size = Config.POEMS_PER_PAGE
-            
-        offset = (page - 1) * page_size
+        
+        after_key = PoemModel._decode_cursor(after) if after else None
+        before_key = PoemModel._decode_cursor(before) if before else None
+        
+        # column 只会是 'author' 或 'dynasty'
+        aggregate_table = 'authors' if column == 'author' else 'dynasties'
         
         with get_db() as conn:
             cursor = conn.cursor()
             
-            # 获取总数
-            cursor.execute('SELECT COUNT(*) as total FROM poems WHERE dynasty = ?', (dynasty,))
+            # 获取总数（读取预计算的统计表）
+            cursor.execute(f'''
+                SELECT COALESCE(SUM(poem_count), 0) AS total FROM {aggregate_table}
+                WHERE {column} = ?
+            ''', (value,))
             total = cursor.fetchone()['total']
             
-            # 获取分页数据（有标题的诗歌优先）
-            cursor.execute('''
-                SELECT * FROM poems 
-                WHERE dynasty = ?
-                ORDER BY 
-                    CASE WHEN title = '无题' THEN 1 ELSE 0 END,
-                    id
-                LIMIT ? OFFSET ?
-            ''', (dynasty, page_size, offset))
+            # 多取一条用于判断是否还有下一页（或上一页）
+            if before_key is not None or after_key is not None:
+                # 行值比较 (is_untitled, id) > (?, ?) 在 SQLite 中只能按 is_untitled 定位，
+                # 因此拆成两段各自沿索引定位的查询再合并
+                if before_key is not None:
+                    op, direction, key = '<', 'DESC', before_key
+                else:
+                    op, direction, key = '>', 'ASC', after_key
+                cursor.execute(f'''
+                    SELECT * FROM (
+                        SELECT {SUMMARY_COLUMNS} FROM poems
+                        WHERE {column} = ?1 AND is_untitled = ?2 AND id {op} ?3
+                        ORDER BY id {direction}
+                        LIMIT ?4
+                    )
+                    UNION ALL
+                    SELECT * FROM (
+                        SELECT {SUMMARY_COLUMNS} FROM poems
+                        WHERE {column} = ?1 AND is_untitled {op} ?2
+                        ORDER BY is_untitled {direction}, id {direction}
+                        LIMIT ?4
+                    )
+                    ORDER BY is_untitled {direction}, id {direction}
+                    LIMIT ?4
+                ''', (value, *key, page_size + 1))
+            else:
+                cursor.execute(f'''
+                    SELECT {SUMMARY_COLUMNS} FROM poems
+                    WHERE {column} = ?
+                    ORDER BY is_untitled, id
+                    LIMIT ?
+                ''', (value, page_size + 1))
             
             rows = cursor.fetchall()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            
+            if before_key is not None:
+                rows.reverse()
+                has_prev, has_next = has_more, before != CURSOR_END
+            else:
+                has_prev, has_next = after_key is not None, has_more
+            
             poems = [PoemModel._row_to_dict(row) for row in rows]
             
             return {
                 'poems': poems,
                 'total': total,
-                'page': page,
                 'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size
+                'has_prev': has_prev and bool(poems),
+                'has_next': has_next and bool(poems),
+                'prev_cursor': PoemModel.encode_cursor(poems[0]) if poems else None,
+                'next_cursor': PoemModel.encode_cursor(poems[-1]) if poems else None
             }
     
+    @staticmethod
+    def suggest(prefix, limit=None):
+        """输入提示：作者、标题、首句的前缀匹配，字母按拼音首字母匹配"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if limit is None:
+            limit = Config.SUGGEST_LIMIT
+        return _suggest_index.suggest(prefix, limit)
+
     @staticmethod
     def get_random(count=1):
-        """获取随机诗词"""
+        """获取随机诗词
+
+        从缓存的 id 数组中均匀抽取不重复的 id，再按主键取行，
+        不再对整张表做 ORDER BY RANDOM() 排序。
+        """
         with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM poems ORDER BY RANDOM() LIMIT ?', (count,))
-            
+            rows = []
+
+            # 缓存过期期间可能有诗词被删除，取不到时刷新 id 缓存重试一次
+            for attempt in range(2):
+                poem_ids = _random_sampler.sample(cursor, count, reload=attempt > 0)
+                if not poem_ids:
+                    break
+
+                placeholders = ','.join('?' * len(poem_ids))
+                text_columns = _get_text_columns(cursor)
+                cursor.execute(f'SELECT {text_columns} FROM poems WHERE id IN ({placeholders})',
+                               poem_ids)
+                found = {row['id']: row for row in cursor.fetchall()}
+                rows = [found[poem_id] for poem_id in poem_ids if poem_id in found]
+
+                if len(rows) == len(poem_ids):
+                    break
+
             if count == 1:
-                row = cursor.fetchone()
-                return PoemModel._row_to_dict(row) if row else None
+                return PoemModel._row_to_dict(rows[0]) if rows else None
             else:
-                rows = cursor.fetchall()
                 return [PoemModel._row_to_dict(row) for row in rows]
-    
+
     @staticmethod
     def get_all_authors(page=1, page_size=None):
-        """获取所有作者列表"""
+        """获取所有作者列表（读取预计算的 authors 表）"""
         if page_size is None:
             page_size = Config.AUTHORS_PER_PAGE
             
@@ -151,14 +632,12 @@ class PoemModel:
             cursor = conn.cursor()
             
             # 获取总数
-            cursor.execute('SELECT COUNT(DISTINCT author) as total FROM poems')
-            total = cursor.fetchone()['total']
+            total = PoemModel._get_meta(cursor, 'total_authors')
             
             # 获取分页数据
             cursor.execute('''
-                SELECT author, dynasty, COUNT(*) as poem_count
-                FROM poems
-                GROUP BY author, dynasty
+                SELECT author, dynasty, poem_count
+                FROM authors
                 ORDER BY poem_count DESC
                 LIMIT ? OFFSET ?
             ''', (page_size, offset))
@@ -176,27 +655,13 @@ class PoemModel:
     
     @staticmethod
     def get_dynasties():
-        """获取所有朝代及诗词数量"""
+        """获取所有朝代及诗词数量（读取预计算的 dynasties 表）"""
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT dynasty, COUNT(*) as poem_count
-                FROM poems
-                GROUP BY dynasty
-                ORDER BY 
-                    CASE dynasty
-                        WHEN '先秦' THEN 1
-                        WHEN '汉' THEN 2
-                        WHEN '魏晋' THEN 3
-                        WHEN '南北朝' THEN 4
-                        WHEN '隋' THEN 5
-                        WHEN '唐' THEN 6
-                        WHEN '宋' THEN 7
-                        WHEN '元' THEN 8
-                        WHEN '明' THEN 9
-                        WHEN '清' THEN 10
-                        ELSE 11
-                    END
+                SELECT dynasty, poem_count
+                FROM dynasties
+                ORDER BY sort_order, dynasty
             ''')
             
             rows = cursor.fetchall()
@@ -204,53 +669,55 @@ class PoemModel:
     
     @staticmethod
     def get_stats():
-        """获取统计信息"""
+        """获取统计信息（导入时预先计算）"""
         with get_db() as conn:
             cursor = conn.cursor()
             
-            # 总诗词数
-            cursor.execute('SELECT COUNT(*) as total_poems FROM poems')
-            total_poems = cursor.fetchone()['total_poems']
-            
-            # 总作者数
-            cursor.execute('SELECT COUNT(DISTINCT author) as total_authors FROM poems')
-            total_authors = cursor.fetchone()['total_authors']
-            
-            # 朝代数
-            cursor.execute('SELECT COUNT(DISTINCT dynasty) as total_dynasties FROM poems')
-            total_dynasties = cursor.fetchone()['total_dynasties']
-            
             return {
-                'total_poems': total_poems,
-                'total_authors': total_authors,
-                'total_dynasties': total_dynasties
+                'total_poems': PoemModel._get_meta(cursor, 'total_poems'),
+                'total_authors': PoemModel._get_meta(cursor, 'total_authors'),
+                'total_dynasties': PoemModel._get_meta(cursor, 'total_dynasties')
             }
     
+    @staticmethod
+    def _get_meta(cursor, key, default=0):
+        """读取 meta 表中的统计值"""
+        cursor.execute('SELECT value FROM meta WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        return row['value'] if row else default
+    
     @staticmethod
     def _row_to_dict(row):
-        """将数据库行转换为字典，解析 JSON 字段"""
+        """将数据库行转换为字典，解码紧凑格式字段（兼容旧版本的 JSON 字段）"""
         if not row:
             return None
             
         poem = dict(row)
         
-        # 解析 JSON 字段
-        if 'paragraphs' in poem and poem['paragraphs']:
+        # 诗句：根据 line_offsets 切分 content
+        line_offsets = poem.pop('line_offsets', None)
+        if line_offsets is not None:
+            poem['paragraphs'] = decode_paragraphs(poem['content'], line_offsets)
+        elif poem.get('paragraphs'):
             try:
                 poem['paragraphs'] = json.loads(poem['paragraphs'])
-            except:
+            except ValueError:
                 poem['paragraphs'] = []
         
-        if 'tags' in poem and poem['tags']:
+        if poem.get('tags'):
             try:
                 poem['tags'] = json.loads(poem['tags'])
-            except:
+            except ValueError:
                 poem['tags'] = []
         
-        if 'pinyin' in poem and poem['pinyin']:
+        # 拼音：音节 id 数组按需解码
+        pinyin = poem.get('pinyin')
+        if isinstance(pinyin, bytes):
+            poem['pinyin'] = LazyPinyin(pinyin, _get_syllables())
+        elif pinyin:
             try:
-                poem['pinyin'] = json.loads(poem['pinyin'])
-            except:
+                poem['pinyin'] = json.loads(pinyin)
+            except ValueError:
                 poem['pinyin'] = []
         
         return poem
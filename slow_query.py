@@ -0,0 +1,128 @@
+"""
+慢查询日志
+
+请求中通过 database.get_db 执行、耗时超过 SLOW_QUERY_THRESHOLD_MS（默认 0，关闭）的 SQL 语句，
+连同参数、耗时、返回行数、所在路由和 EXPLAIN QUERY PLAN 的结果，以 JSON 行的形式追加到 SLOW_QUERY_LOG。
+查询计划中的全表扫描（SCAN 表 且未使用索引）和临时 B 树排序（USE TEMP B-TREE）会单独标记。
+导入、生成拼音等脚本中的语句（不在请求中）不记录；写连接上的语句只记录、不执行 EXPLAIN。
+每次记录都重新以追加方式打开文件，logrotate 移走文件后自动写入新文件。
+
+按 SLOW_QUERY_SAMPLE_RATE 抽样，每个进程每分钟最多记录 SLOW_QUERY_MAX_PER_MINUTE 条，
+慢查询集中出现时也不会因为反复执行 EXPLAIN 和写日志而雪上加霜。
+汇总报告：python data/scripts/slow_query_report.py
+"""
+
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import metrics
+from config import Config
+
+# 参数中的长字符串只保留开头部分
+MAX_PARAMETER_LENGTH = 200
+
+SLOW_QUERIES = metrics.Counter('poetry_slow_queries_total',
+                               '慢查询次数（outcome：logged 已记录 / sampled_out 未抽中 / rate_limited 超出频率限制 / write_failed 写入失败）',
+                               ('outcome',))
+
+_lock = threading.Lock()
+_window_started = 0.0
+_window_count = 0
+
+def _allow():
+    """抽样和频率限制（每分钟一个窗口）"""
+    global _window_started, _window_count
+    if random.random() >= Config.SLOW_QUERY_SAMPLE_RATE:
+        SLOW_QUERIES.inc('sampled_out')
+        return False
+
+    now = time.monotonic()
+    with _lock:
+        if now - _window_started >= 60:
+            _window_started = now
+            _window_count = 0
+        if _window_count >= Config.SLOW_QUERY_MAX_PER_MINUTE:
+            SLOW_QUERIES.inc('rate_limited')
+            return False
+        _window_count += 1
+    return True
+
+def _format_parameter(value):
+    """参数转换为可写入 JSON 的值（二进制只记录长度，长字符串截断）"""
+    if isinstance(value, bytes):
+        return f'<blob {len(value)} bytes>'
+    if isinstance(value, str) and len(value) > MAX_PARAMETER_LENGTH:
+        return value[:MAX_PARAMETER_LENGTH] + '…'
+    return value
+
+def format_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: _format_parameter(value) for key, value in parameters.items()}
+    return [_format_parameter(value) for value in parameters]
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN 的结果，按层级缩进；无法获取时返回空列表"""
+    try:
+        # 直接使用 sqlite3.Cursor，EXPLAIN 本身不再被计时和记录
+        rows = sqlite3.Cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+    except sqlite3.Error:
+        return []
+
+    depth = {0: -1}
+    plan = []
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], row[3]
+        depth[node_id] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node_id] + detail)
+    return plan
+
+# 全表扫描：SCAN 表名 且没有 USING INDEX / VIRTUAL TABLE（全文索引）等
+_SCAN = re.compile(r'^\s*SCAN (\S+)(?!.*\b(?:USING|VIRTUAL TABLE)\b)')
+# 子查询的结果（扫描它们不是全表扫描）
+_SUBQUERY = re.compile(r'^\s*(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+
+def plan_flags(plan):
+    """查询计划中是否有全表扫描、临时 B 树排序"""
+    subqueries = {match.group(1) for match in map(_SUBQUERY.match, plan) if match}
+    scans = [match.group(1) for match in map(_SCAN.match, plan) if match]
+    return {
+        'full_scan': any(name not in subqueries and name != 'CONSTANT' for name in scans),
+        'temp_btree': any('USE TEMP B-TREE' in line for line in plan),
+    }
+
+def record(conn, sql, parameters, elapsed, rows):
+    """记录一条慢查询（由 database.InstrumentedCursor 调用）"""
+    route = metrics.current_route()
+    if route is None or not _allow():
+        return
+
+    # 写连接上重放 EXPLAIN 可能与正在进行的写事务竞争，不执行
+    plan = explain(conn, sql, parameters) if getattr(conn, 'readonly', True) else []
+    entry = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+        'route': route,
+        'elapsed_ms': round(elapsed * 1000, 3),
+        'rows': rows,
+        'sql': ' '.join(sql.split()),
+        'parameters': format_parameters(parameters),
+        'plan': plan,
+        **plan_flags(plan),
+    }
+    line = json.dumps(entry, ensure_ascii=False, default=repr) + '\n'
+    try:
+        # 追加写入的单行在多个 worker 进程之间不会交错
+        directory = os.path.dirname(Config.SLOW_QUERY_LOG)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(Config.SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except OSError:
+        SLOW_QUERIES.inc('write_failed')
+        return
+    SLOW_QUERIES.inc('logged')
@@ -23,6 +23,16 @@ document.addEventListener('DOMContentLoaded', function() {
         searchInput.focus();
     }
     
+    // 搜索框输入提示
+    const headerSearchInput = document.querySelector('.search-form input[list]');
+    if (headerSearchInput) {
+        let suggestTimer = null;
+        headerSearchInput.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+            suggestTimer = setTimeout(() => updateSuggestions(this), 150);
+        });
+    }
+    
     // 拼音显示控制
     const pinyinToggle = document.getElementById('show-pinyin');
     if (pinyinToggle) {
@@ -48,6 +58,29 @@ function togglePinyin(show) {
     });
 }
 
+// 根据输入内容更新搜索框的提示列表
+async function updateSuggestions(input) {
+    const datalist = document.getElementById(input.getAttribute('list'));
+    const keyword = input.value.trim();
+    if (!datalist || !keyword) {
+        return;
+    }
+    try {
+        const response = await fetch(`/api/suggest?q=${encodeURIComponent(keyword)}`);
+        const data = await response.json();
+        if (data.success && input.value.trim() === keyword) {
+            datalist.innerHTML = '';
+            data.data.forEach(item => {
+                const option = document.createElement('option');
+                option.value = item.text;
+                datalist.appendChild(option);
+            });
+        }
+    } catch (error) {
+        console.error('获取输入提示失败:', error);
+    }
+}
+
 // 随机诗词 API 调用示例
 async function getRandomPoem() {
     try {